@@ -2,6 +2,11 @@ import argparse
 from pathlib import Path
 import os
 import yaml
+try:
+    # 优先使用libyaml的C实现
+    from yaml import CFullLoader as _YamlLoader
+except ImportError:
+    from yaml import FullLoader as _YamlLoader
 
 from ..server.flask_server.flask_server import FlaskCrewServer
 def start_flask():
@@ -38,7 +43,7 @@ def start_flask():
         return
     
     with open(config_path, "r", encoding='utf-8') as f:
-        crew_config = yaml.load(f, Loader=yaml.FullLoader)
+        crew_config = yaml.load(f, Loader=_YamlLoader)
     
     # 创建并启动服务器
     server = FlaskCrewServer(
@@ -2,6 +2,11 @@ import argparse
 from pathlib import Path
 import os
 import yaml
+try:
+    # 优先使用libyaml的C实现
+    from yaml import CFullLoader as _YamlLoader
+except ImportError:
+    from yaml import FullLoader as _YamlLoader
 
 from ..server.quart_server.quart_server import QuartCrewServer
 def start_quart():
@@ -40,7 +45,7 @@ def start_quart():
         return
     
     with open(config_path, "r", encoding='utf-8') as f:
-        crew_config = yaml.load(f, Loader=yaml.FullLoader)
+        crew_config = yaml.load(f, Loader=_YamlLoader)
     
     # 创建并启动服务器
     server = QuartCrewServer(
@@ -9,12 +9,17 @@ import os
 import sys
 import json
 import uuid
+import logging
 import threading
 import argparse
 import re
 import signal
+import itertools
+import collections
+import shutil
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 from dataclasses import dataclass
@@ -35,6 +40,158 @@ from ...crew import VaspCrew
 from crewai import Task
 from fastmcp.client import Client
 
+logger = logging.getLogger(__name__)
+
+# 允许上传的结构文件：.vasp/.cif/.xyz 扩展名或 POSCAR/CONTCAR（不区分大小写）
+_ALLOWED_RE = re.compile(r'(?i)(?:\.(?:vasp|cif|xyz)$|^(?:poscar|contcar)$)')
+
+# 日志类型显示名称
+_TYPE_NAMES = {
+    'system': '系统',
+    'agent_input': 'Agent输入',
+    'agent_output': 'Agent输出',
+    'tool_input': 'Tool输入',
+    'tool_output': 'Tool输出'
+}
+
+# 从日志中提取计算ID所用的正则（模块级预编译）
+_UUID_PATTERN = r'[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}'
+_UUID_RE = re.compile(_UUID_PATTERN, re.IGNORECASE)
+_CALC_ID_RES = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'"calculation_id":\s*"([^"]+)"',
+    r"'calculation_id':\s*'([^']+)'",
+    r'calculation_id.*?(' + _UUID_PATTERN + ')',
+))
+
+_CALC_ID_KEY = '"calculation_id"'
+
+
+def _scan_json_calc_ids(content: str) -> List[str]:
+    """直接按字符串查找 "calculation_id": "<值>"，不构造JSON对象、不使用正则。"""
+    found = []
+    n = len(content)
+    idx = content.find(_CALC_ID_KEY)
+    while idx != -1:
+        pos = idx + len(_CALC_ID_KEY)
+        while pos < n and content[pos].isspace():
+            pos += 1
+        if pos < n and content[pos] == ':':
+            pos += 1
+            while pos < n and content[pos].isspace():
+                pos += 1
+            if pos < n and content[pos] == '"':
+                end = content.find('"', pos + 1)
+                if end > pos + 1:
+                    found.append(content[pos + 1:end])
+        idx = content.find(_CALC_ID_KEY, pos)
+    return found
+
+
+def _to_json_log_content(message: Any) -> str:
+    """将Tool消息转换为日志内容：dict/list 序列化为JSON，已是JSON文本的字符串原样保存，其余包装为 {"raw": ...}。"""
+    if isinstance(message, (dict, list)):
+        return json.dumps(message, ensure_ascii=False)
+    text = str(message)
+    if text.lstrip().startswith(('{', '[')):
+        return text
+    return json.dumps({"raw": text}, ensure_ascii=False)
+
+
+def _list_task_files(task_dir: str, conversation_id: str) -> List[Dict[str, Any]]:
+    """递归列出任务目录中的文件记录（阻塞的文件系统访问，由调用方放到线程中执行）"""
+    from urllib.parse import quote
+    
+    files = []
+    pending_dirs = [task_dir]
+    while pending_dirs:
+        with os.scandir(pending_dirs.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    pending_dirs.append(entry.path)
+                    continue
+                if not entry.is_file():
+                    continue
+                filename = entry.name
+                relative_path = os.path.relpath(entry.path, task_dir)
+                lower_name = filename.lower()
+                file_type = 'unknown'
+                
+                if lower_name.endswith(('.png', '.jpg', '.jpeg', '.gif')):
+                    file_type = 'image'
+                elif lower_name.endswith(('.vasp', '.xyz', '.cif')):
+                    file_type = 'structure'
+                elif lower_name.endswith(('.txt', '.log', '.out')):
+                    file_type = 'text'
+                
+                # 对路径进行分段编码
+                encoded_path = '/'.join(quote(segment, safe='') for segment in relative_path.split('/'))
+                
+                files.append({
+                    'filename': filename,
+                    'path': relative_path,
+                    'size': entry.stat().st_size,
+                    'type': file_type,
+                    'url': f'/api/files/{conversation_id}/{encoded_path}'
+                })
+    return files
+
+
+def _in_event_loop() -> bool:
+    """当前线程是否正在运行事件循环（此时不能阻塞等待）"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+# 日志写入语句（单行与多行 VALUES 拼接两种形式）
+_LOG_INSERT_SQL = (
+    'INSERT INTO activity_logs (conversation_id, type, role_name, content, timestamp) '
+    'VALUES (?, ?, ?, ?, ?)'
+)
+# 任务状态变更合并写入：行在提交时已插入，未变更的字段保持原值
+_TASK_UPDATE_SQL = (
+    'UPDATE task_executions SET status = ?, '
+    'started_at = COALESCE(?, started_at), completed_at = COALESCE(?, completed_at), '
+    'result = COALESCE(?, result), error_message = COALESCE(?, error_message) '
+    'WHERE conversation_id = ?'
+)
+# 每条多行 INSERT 的行数（5 列 × 128 行 = 640 个参数，低于 SQLite 默认 999 上限）
+_LOG_ROWS_PER_STATEMENT = 128
+_LOG_MULTI_INSERT_SQL = (
+    'INSERT INTO activity_logs (conversation_id, type, role_name, content, timestamp) VALUES '
+    + ', '.join(['(?, ?, ?, ?, ?)'] * _LOG_ROWS_PER_STATEMENT)
+)
+
+
+@lru_cache(maxsize=4096)
+def _str_to_beijing_time_str(value: str) -> str:
+    """将数据库中的 UTC/本地时间字符串转换为北京时间字符串（结果缓存，重复时间戳直接命中）。"""
+    s = value.strip()
+    dt: Optional[datetime] = None
+    # 先尝试常见格式
+    for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"):
+        try:
+            dt = datetime.strptime(s, fmt)
+            break
+        except Exception:
+            dt = None
+    if dt is None:
+        # 退回ISO格式（支持末尾Z）
+        try:
+            dt = datetime.fromisoformat(s[:-1] if s.endswith('Z') else s)
+        except Exception:
+            return value
+    return _datetime_to_beijing_time_str(dt)
+
+
+def _datetime_to_beijing_time_str(dt: datetime) -> str:
+    """将datetime转换为北京时间字符串，无时区信息时假定为UTC（数据库 CURRENT_TIMESTAMP）。"""
+    if dt.tzinfo is not None and dt.utcoffset() is not None:
+        dt = (dt - dt.utcoffset()).replace(tzinfo=None)
+    return (dt + timedelta(hours=8)).strftime("%Y-%m-%d %H:%M:%S")
+
 
 class TaskStatus(Enum):
     """任务状态枚举"""
@@ -76,6 +233,32 @@ class QuartCrewServer(CrewServer):
         self.task_queue: List[QueuedTask] = []
         self.task_semaphore = asyncio.Semaphore(max_concurrent_tasks)
         self._current_conversation_id: Optional[str] = None
+        # 数据库中的任务计数缓存（由后台任务定期同步，状态接口只读内存）
+        self._db_counts_cache: Dict[str, int] = {'running': 0, 'queued': 0}
+        self._db_counts_interval = 5.0
+        self._db_counts_task: Optional[asyncio.Task] = None
+        # 提交任务时的准入检查与入库需原子完成
+        self._submit_lock = asyncio.Lock()
+        # 日志批量写入：回调（任意线程）只向缓冲区追加，由单一后台写入任务定期取出并在一个事务中批量提交。
+        # 缓冲区达到上限时工作线程等待写入任务腾出空间；超过高水位时丢弃新的 system 日志并计数
+        self._log_buffer: collections.deque = collections.deque()
+        self._log_buffer_limit = 100_000
+        self._log_buffer_high_water = 90_000
+        self._log_space = threading.Condition()
+        self._log_dropped = 0
+        self._log_batch_size = 256
+        self._log_flush_interval = 0.05
+        # 写入失败的批次只整批重试一次，仍失败则逐条写入并丢弃写不进去的日志；连续失败时按指数退避等待
+        self._log_max_retries = 1
+        self._log_max_backoff = 5.0
+        self._log_stopping = False
+        self._log_writer: Optional[asyncio.Task] = None
+        self._log_conn: Optional[aiosqlite.Connection] = None
+        # 尚未落库的任务状态变更（conversation_id -> 合并后的字段），由日志写入任务一并提交
+        self._task_state: Dict[str, Dict[str, Any]] = {}
+        # 控制连接：task_executions 写入共用一个长期连接（与日志写入连接分开）
+        self._db: Optional[aiosqlite.Connection] = None
+        self._db_lock = asyncio.Lock()
         
         # 数据库路径
         if db_path is None:
@@ -97,8 +280,11 @@ class QuartCrewServer(CrewServer):
         self._conversation_to_fingerprint: Dict[str, str] = {}
         self._fingerprint_to_conversation: Dict[str, str] = {}
         self._mapping_lock = threading.Lock()
-        self._running_threads: Dict[str, threading.Thread] = {}
+        # 各会话 crew 执行线程结束时由线程回调完成的 future（替代轮询 is_alive）
+        self._crew_done: Dict[str, asyncio.Future] = {}
         self._crew_thread_ids: Dict[str, int] = {}
+        # 任务报告文件名后缀（每个任务有独立目录，计数器足以保证不重名）
+        self._output_counter = itertools.count(1)
         
         # 设置路由
         self._setup_routes()
@@ -143,6 +329,12 @@ class QuartCrewServer(CrewServer):
                     )
                 ''')
                 
+                # 兼容旧数据库：补充缺失的 role_name 列
+                async with conn.execute("PRAGMA table_info(activity_logs)") as cursor:
+                    log_columns = [row[1] async for row in cursor]
+                if 'role_name' not in log_columns:
+                    await conn.execute('ALTER TABLE activity_logs ADD COLUMN role_name TEXT')
+                
                 await conn.commit()
                 
                 # 验证表是否创建成功
@@ -194,88 +386,96 @@ class QuartCrewServer(CrewServer):
         if db is not None:
             await db.close()
 
+    def _with_task_state(self, row) -> Dict[str, Any]:
+        """将任务记录行转换为字典，并合并内存中尚未落库的状态变更"""
+        task = dict(row)
+        task.update(self._task_state.get(task['conversation_id'], {}))
+        return task
+
     async def _get_recent_tasks(self, limit=10):
-        """获取最近的任务"""
+        """获取最近的任务，合并内存中尚未落库的状态变更"""
         async with aiosqlite.connect(self.db_path) as db:
             db.row_factory = aiosqlite.Row
             async with db.execute(
                 'SELECT * FROM task_executions ORDER BY created_at DESC LIMIT ?',
                 (limit,)
             ) as cursor:
-                return await cursor.fetchall()
+                rows = await cursor.fetchall()
+        return [self._with_task_state(row) for row in rows]
 
     async def _get_task_by_id(self, conversation_id):
-        """根据ID获取任务"""
+        """根据ID获取任务，合并内存中尚未落库的状态变更"""
         async with aiosqlite.connect(self.db_path) as db:
             db.row_factory = aiosqlite.Row
             async with db.execute(
                 'SELECT * FROM task_executions WHERE conversation_id = ?',
                 (conversation_id,)
             ) as cursor:
-                return await cursor.fetchone()
+                row = await cursor.fetchone()
+        return self._with_task_state(row) if row is not None else None
 
     async def _get_task_logs(self, conversation_id):
         """获取任务日志"""
         async with aiosqlite.connect(self.db_path) as db:
             db.row_factory = aiosqlite.Row
+            # 显式列出 role_name，保证字段始终存在（旧数据为 NULL）
             async with db.execute(
-                'SELECT * FROM activity_logs WHERE conversation_id = ? ORDER BY timestamp',
+                'SELECT type, role_name, content, timestamp FROM activity_logs WHERE conversation_id = ? ORDER BY timestamp',
                 (conversation_id,)
             ) as cursor:
                 logs = await cursor.fetchall()
         
         # 格式化日志
-        formatted_logs = []
-        for log in logs:
-            type_names = {
-                'system': '系统',
-                'agent_input': 'Agent输入',
-                'agent_output': 'Agent输出',
-                'tool_input': 'Tool输入',
-                'tool_output': 'Tool输出'
-            }
-            
-            # 安全地获取role_name字段（兼容旧数据）
-            try:
-                role_name = log['role_name'] if 'role_name' in log.keys() else None
-            except (KeyError, TypeError):
-                role_name = None
-            
-            formatted_logs.append({
+        to_bj = self._to_beijing_time_str
+        return [
+            {
                 'type': log['type'],
-                'type_name': type_names.get(log['type'], log['type']),
-                'role_name': role_name,
+                'type_name': _TYPE_NAMES.get(log['type'], log['type']),
+                'role_name': log['role_name'],
                 'content': log['content'],
-                'timestamp': self._to_beijing_time_str(log['timestamp']),
+                'timestamp': to_bj(log['timestamp']),
                 'preview': log['content'][:30] + '...' if len(log['content']) > 30 else log['content']
-            })
-        
-        return formatted_logs
+            }
+            for log in logs
+        ]
 
     async def _get_queue_status(self):
-        """获取队列状态"""
-        running_count = len(self.running_tasks)
-        queued_count = len(self.task_queue)
-        
-        # 从数据库获取最新状态
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("SELECT COUNT(*) as count FROM task_executions WHERE status = 'running'") as cursor:
-                db_running = await cursor.fetchone()
-                db_running_count = db_running[0] if db_running else 0
-            
-            async with db.execute("SELECT COUNT(*) as count FROM task_executions WHERE status = 'queued'") as cursor:
-                db_queued = await cursor.fetchone()
-                db_queued_count = db_queued[0] if db_queued else 0
-        
+        """获取队列状态（纯内存读取，数据库计数来自后台同步的缓存）"""
         return {
-            'running_count': running_count,
-            'queued_count': queued_count,
-            'db_running_count': db_running_count,
-            'db_queued_count': db_queued_count,
+            'running_count': len(self.running_tasks),
+            'queued_count': len(self.task_queue),
+            'db_running_count': self._db_counts_cache['running'],
+            'db_queued_count': self._db_counts_cache['queued'],
             'max_concurrent': self.max_concurrent_tasks,
             'max_queue_size': self.max_queue_size
         }
 
+    async def _refresh_db_counts(self):
+        """从数据库同步运行中/排队中的任务计数到缓存，尚未落库的任务按内存中的状态计数"""
+        counts = {'running': 0, 'queued': 0}
+        # 查询前取快照：查询期间落库的变更仍以快照中的状态计数
+        pending = {cid: state['status'] for cid, state in self._task_state.items()}
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute(
+                "SELECT conversation_id, status FROM task_executions WHERE status IN ('running', 'queued')"
+            ) as cursor:
+                async for conversation_id, status in cursor:
+                    if conversation_id not in pending:
+                        counts[status] += 1
+        for status in pending.values():
+            if status in counts:
+                counts[status] += 1
+        self._db_counts_cache = counts
+
+    async def _sync_db_counts_loop(self):
+        """后台定期同步数据库任务计数"""
+        while True:
+            try:
+                await self._refresh_db_counts()
+            except Exception as e:
+                logger.warning("同步数据库任务计数失败: %s", e)
+            await asyncio.sleep(self._db_counts_interval)
+
     def _to_beijing_time_str(self, value: Any) -> Optional[str]:
         """将传入的 UTC/本地时间字符串或datetime转换为北京时间字符串。
         - 支持 str: 'YYYY-MM-DD HH:MM:SS[.ffffff]' 或 ISO 格式；
@@ -284,54 +484,40 @@ class QuartCrewServer(CrewServer):
         """
         if value is None:
             return None
-        dt: Optional[datetime] = None
+        if isinstance(value, str):
+            return _str_to_beijing_time_str(value)
         if isinstance(value, datetime):
-            dt = value
-        elif isinstance(value, str):
-            s = value.strip()
-            # 先尝试常见格式
-            for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"):
-                try:
-                    dt = datetime.strptime(s, fmt)
-                    break
-                except Exception:
-                    dt = None
-            if dt is None:
-                # 退回ISO格式
-                try:
-                    # 支持末尾Z
-                    if s.endswith('Z'):
-                        s = s[:-1]
-                        dt = datetime.fromisoformat(s)
-                    else:
-                        dt = datetime.fromisoformat(s)
-                except Exception:
-                    return value
-        else:
-            return str(value)
+            return _datetime_to_beijing_time_str(value)
+        return str(value)
 
-        # 将有时区信息的时间转换为UTC无tz的时间
-        if dt.tzinfo is not None and dt.utcoffset() is not None:
-            dt_utc = dt - dt.utcoffset()
-        else:
-            # 假定数据库的 CURRENT_TIMESTAMP 为UTC
-            dt_utc = dt
-
-        bj_dt = dt_utc + timedelta(hours=8)
-        return bj_dt.strftime("%Y-%m-%d %H:%M:%S")
-
-    def _format_task_row(self, row: aiosqlite.Row) -> Dict[str, Any]:
-        """将任务记录行转换为带北京时间字符串的字典。"""
-        return {
+    def _format_task_row(self, row: Dict[str, Any], include_result: bool = True) -> Dict[str, Any]:
+        """将任务记录行转换为带北京时间字符串的字典（每个时间字段只转换一次）。"""
+        to_bj = self._to_beijing_time_str
+        task = {
             'conversation_id': row['conversation_id'],
             'task_description': row['task_description'],
             'status': row['status'],
-            'created_at': self._to_beijing_time_str(row['created_at']),
-            'started_at': self._to_beijing_time_str(row['started_at']) if 'started_at' in row.keys() else None,
-            'completed_at': self._to_beijing_time_str(row['completed_at']) if 'completed_at' in row.keys() else None,
-            'result': row['result'] if 'result' in row.keys() else None,
-            'error_message': row['error_message'] if 'error_message' in row.keys() else None,
+            'created_at': to_bj(row['created_at']),
+            'started_at': to_bj(row['started_at']) if row['started_at'] else None,
+            'completed_at': to_bj(row['completed_at']) if row['completed_at'] else None,
         }
+        if include_result:
+            task['result'] = row['result']
+            task['error_message'] = row['error_message']
+        return task
+
+    @staticmethod
+    def _write_upload(stream, save_path: str, chunk_size: int = 65536) -> None:
+        """分块写入上传文件，先写临时文件再原子重命名，避免留下不完整文件。"""
+        tmp_path = f"{save_path}.part"
+        try:
+            with open(tmp_path, 'wb') as f:
+                shutil.copyfileobj(stream, f, chunk_size)
+            os.replace(tmp_path, save_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
 
     def _setup_routes(self):
         """设置Quart路由"""
@@ -340,6 +526,14 @@ class QuartCrewServer(CrewServer):
         async def close_connection(exception):
             await self._close_connection(exception)
 
+        @self.app.before_serving
+        async def start_background_tasks():
+            await self._start_background_tasks()
+
+        @self.app.after_serving
+        async def shutdown_background_tasks():
+            await self._stop_background_tasks()
+
         # 统一API错误为JSON，避免返回HTML导致前端解析错误
         @self.app.errorhandler(404)
         async def handle_404(error):
@@ -383,13 +577,12 @@ class QuartCrewServer(CrewServer):
                     return jsonify({'error': 'No file uploaded'}), 400
 
                 filename = secure_filename(file.filename)
-                lower_name = filename.lower()
-                if not (lower_name.endswith(('.vasp', '.cif', '.xyz')) or lower_name in ('poscar', 'contcar')):
+                if not _ALLOWED_RE.search(filename):
                     return jsonify({'error': 'File type not supported. Only .vasp/.cif/.xyz or POSCAR/CONTCAR are allowed'}), 400
 
                 unique_name = f"{uuid.uuid4().hex}_{filename}"
                 save_path = os.path.join(self.upload_dir, unique_name)
-                await file.save(save_path)
+                await asyncio.to_thread(self._write_upload, file.stream, save_path)
                 abs_path = os.path.abspath(save_path)
                 return jsonify({'success': True, 'path': abs_path, 'filename': filename})
             except Exception as e:
@@ -405,29 +598,29 @@ class QuartCrewServer(CrewServer):
                 if not task_description:
                     return jsonify({'error': 'Please enter a valid task description'}), 400
                 
-                # 检查队列是否已满
-                current_queue_size = len(self.task_queue)
-                current_running = len(self.running_tasks)
-                
-                if current_queue_size + current_running >= self.max_queue_size + self.max_concurrent_tasks:
-                    return jsonify({'error': f'队列已满，当前运行: {current_running}, 队列中: {current_queue_size}, 最大限制: {self.max_queue_size + self.max_concurrent_tasks}'}), 400
-                
-                # 创建任务记录
-                conversation_id = str(uuid.uuid4())
-                async with aiosqlite.connect(self.db_path) as db:
-                    await db.execute(
+                max_total = self.max_queue_size + self.max_concurrent_tasks
+                async with self._submit_lock:
+                    # 按本进程内存中的队列计数准入；检查、插入与入队在锁内完成，并发提交不会超出上限
+                    current_queue_size = len(self.task_queue)
+                    current_running = len(self.running_tasks)
+                    if current_queue_size + current_running >= max_total:
+                        return jsonify({'error': f'队列已满，当前运行: {current_running}, 队列中: {current_queue_size}, 最大限制: {max_total}'}), 400
+                    
+                    # 创建任务记录
+                    conversation_id = str(uuid.uuid4())
+                    await self._execute_control(
                         'INSERT INTO task_executions (conversation_id, task_description, status) VALUES (?, ?, ?)',
                         (conversation_id, task_description, TaskStatus.QUEUED.value)
                     )
-                    await db.commit()
-                
-                # 添加到队列并尝试处理
-                queued_task = QueuedTask(
-                    conversation_id=conversation_id,
-                    task_description=task_description,
-                    created_at=datetime.now()
-                )
-                self.task_queue.append(queued_task)
+                    
+                    # 添加到队列
+                    queued_task = QueuedTask(
+                        conversation_id=conversation_id,
+                        task_description=task_description,
+                        created_at=datetime.now()
+                    )
+                    self.task_queue.append(queued_task)
+                    queue_position = len(self.task_queue)
                 
                 # 异步处理队列
                 asyncio.create_task(self._process_queue())
@@ -436,7 +629,7 @@ class QuartCrewServer(CrewServer):
                     'success': True,
                     'conversation_id': conversation_id,
                     'message': 'Task submitted successfully',
-                    'queue_position': len(self.task_queue)
+                    'queue_position': queue_position
                 })
                 
             except Exception as e:
@@ -453,16 +646,7 @@ class QuartCrewServer(CrewServer):
             recent_tasks_rows = await self._get_recent_tasks()
             recent_tasks = [self._format_task_row(row) for row in recent_tasks_rows]
             # 任务详情时间转为北京时间
-            task_dict = {
-                'conversation_id': task['conversation_id'],
-                'task_description': task['task_description'],
-                'status': task['status'],
-                'created_at': self._to_beijing_time_str(task['created_at']),
-                'started_at': self._to_beijing_time_str(task['started_at']) if task['started_at'] else None,
-                'completed_at': self._to_beijing_time_str(task['completed_at']) if task['completed_at'] else None,
-                'result': task['result'],
-                'error_message': task['error_message']
-            }
+            task_dict = self._format_task_row(task)
             queue_status = await self._get_queue_status()
             
             return await render_template('task_detail.html',
@@ -522,16 +706,7 @@ class QuartCrewServer(CrewServer):
             """获取任务列表API"""
             try:
                 recent_tasks = await self._get_recent_tasks()
-                tasks_data = []
-                for task in recent_tasks:
-                    tasks_data.append({
-                        'conversation_id': task['conversation_id'],
-                        'task_description': task['task_description'],
-                        'status': task['status'],
-                        'created_at': self._to_beijing_time_str(task['created_at']),
-                        'started_at': self._to_beijing_time_str(task['started_at']) if task['started_at'] else None,
-                        'completed_at': self._to_beijing_time_str(task['completed_at']) if task['completed_at'] else None
-                    })
+                tasks_data = [self._format_task_row(task, include_result=False) for task in recent_tasks]
                 return jsonify(tasks_data)
             except Exception as e:
                 return jsonify({'error': f'Failed to get task list: {str(e)}'}), 500
@@ -608,41 +783,13 @@ class QuartCrewServer(CrewServer):
         @self.app.route('/api/files/<conversation_id>/list')
         async def list_task_files(conversation_id):
             """列出任务目录中的所有文件"""
-            from urllib.parse import quote
-            
             try:
                 task_dir = os.path.join(self.work_dir, conversation_id)
-                if not os.path.exists(task_dir):
+                if not await asyncio.to_thread(os.path.exists, task_dir):
                     return jsonify({'files': []})
                 
-                files = []
-                for root, dirs, filenames in os.walk(task_dir):
-                    for filename in filenames:
-                        file_path = os.path.join(root, filename)
-                        relative_path = os.path.relpath(file_path, task_dir)
-                        file_size = os.path.getsize(file_path)
-                        file_type = 'unknown'
-                        
-                        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-                            file_type = 'image'
-                        elif filename.lower().endswith(('.vasp', '.xyz', '.cif')):
-                            file_type = 'structure'
-                        elif filename.lower().endswith(('.txt', '.log', '.out')):
-                            file_type = 'text'
-                        
-                        # 对路径进行分段编码
-                        path_segments = relative_path.split('/')
-                        encoded_segments = [quote(segment, safe='') for segment in path_segments]
-                        encoded_path = '/'.join(encoded_segments)
-                        
-                        files.append({
-                            'filename': filename,
-                            'path': relative_path,
-                            'size': file_size,
-                            'type': file_type,
-                            'url': f'/api/files/{conversation_id}/{encoded_path}'
-                        })
-                
+                # 目录遍历在线程中进行，不阻塞事件循环
+                files = await asyncio.to_thread(_list_task_files, task_dir, conversation_id)
                 return jsonify({'files': files})
                 
             except Exception as e:
@@ -659,8 +806,10 @@ class QuartCrewServer(CrewServer):
                 if not task:
                     return jsonify({'error': '任务未找到', 'conversation_id': conversation_id, 'fingerprint': known_fingerprint}), 404
                 
+                status = task['status']
+                
                 # 若fingerprint暂不可用且任务处于运行态，短暂等待映射建立以缓解竞态
-                if not known_fingerprint and task['status'] == 'running':
+                if not known_fingerprint and status == 'running':
                     for _ in range(10):
                         await asyncio.sleep(0.05)
                         known_fingerprint = self._conversation_to_fingerprint.get(conversation_id)
@@ -668,14 +817,14 @@ class QuartCrewServer(CrewServer):
                             break
                 
                 # 检查任务状态
-                if task['status'] not in ['running', 'queued']:
-                    return jsonify({'error': f'任务状态为 {task["status"]}，无法取消', 'conversation_id': conversation_id, 'fingerprint': known_fingerprint}), 400
+                if status not in ['running', 'queued']:
+                    return jsonify({'error': f'任务状态为 {status}，无法取消', 'conversation_id': conversation_id, 'fingerprint': known_fingerprint}), 400
                 
                 success = False
                 message = ""
                 
-                # 如果任务在队列中，直接从队列移除
-                if task['status'] == 'queued':
+                # 如果任务在队列中（尚未开始执行），直接从队列移除
+                if status == 'queued' and conversation_id not in self.running_tasks:
                     self.task_queue = [t for t in self.task_queue if t.conversation_id != conversation_id]
                     success = True
                     message = f"任务已从队列中移除 (conversation_id={conversation_id}, fingerprint={known_fingerprint})"
@@ -720,12 +869,7 @@ class QuartCrewServer(CrewServer):
                 
                 if success:
                     # 更新数据库状态
-                    async with aiosqlite.connect(self.db_path) as db:
-                        await db.execute(
-                            'UPDATE task_executions SET status = ?, completed_at = CURRENT_TIMESTAMP, error_message = ? WHERE conversation_id = ?',
-                            ('cancelled', 'Task cancelled', conversation_id)
-                        )
-                        await db.commit()
+                    await self._update_task_state(conversation_id, 'cancelled', error_message='Task cancelled')
                 
                 return jsonify({
                     'success': success,
@@ -794,58 +938,61 @@ class QuartCrewServer(CrewServer):
 
     async def _extract_calc_ids_from_logs(self, conversation_id):
         """从任务日志中提取计算任务ID"""
-        calc_ids = []
+        # 用 dict 保序去重
+        calc_ids: Dict[str, None] = {}
         try:
-            logs = await self._get_task_logs(conversation_id)
+            # 只取可能含有计算ID的日志：tool_output，或至少含4个连字符（UUID的必要条件）
+            async with aiosqlite.connect(self.db_path) as db:
+                async with db.execute(
+                    "SELECT type, content FROM activity_logs WHERE conversation_id = ? "
+                    "AND (type = 'tool_output' OR content LIKE '%-%-%-%-%') ORDER BY timestamp",
+                    (conversation_id,)
+                ) as cursor:
+                    logs = await cursor.fetchall()
             
-            for log in logs:
-                content = log['content']
-                
+            for log_type, content in logs:
                 # 从tool_output中查找calculation_id
-                if log['type'] == 'tool_output':
-                    try:
-                        # 尝试解析JSON内容
-                        json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                        if json_match:
-                            tool_data = json.loads(json_match.group())
-                            if isinstance(tool_data, dict):
-                                # 查找calculation_id字段
-                                if 'calculation_id' in tool_data:
-                                    calc_ids.append(tool_data['calculation_id'])
-                                # 也检查嵌套结构中的calculation_id
-                                elif isinstance(tool_data, dict):
-                                    for key, value in tool_data.items():
-                                        if isinstance(value, dict) and 'calculation_id' in value:
-                                            calc_ids.append(value['calculation_id'])
-                    except (json.JSONDecodeError, AttributeError):
-                        # 如果JSON解析失败，使用正则表达式查找
-                        calc_id_patterns = [
-                            r'"calculation_id":\s*"([^"]+)"',
-                            r"'calculation_id':\s*'([^']+)'",
-                            r'calculation_id.*?([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})'
-                        ]
-                        for pattern in calc_id_patterns:
-                            matches = re.findall(pattern, content, re.IGNORECASE)
-                            calc_ids.extend(matches)
-                
-                # 从其他日志类型中查找UUID格式的计算ID
-                uuid_pattern = r'[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}'
-                uuid_matches = re.findall(uuid_pattern, content, re.IGNORECASE)
+                if log_type == 'tool_output' and 'calculation_id' in content:
+                    found = _scan_json_calc_ids(content)
+                    if not found:
+                        found = self._parse_calc_ids_from_json(content)
+                    calc_ids.update(dict.fromkeys(found))
                 
-                # 过滤掉对话ID本身，只保留计算ID
-                for match in uuid_matches:
-                    if match != conversation_id and match not in calc_ids:
-                        calc_ids.append(match)
+                # 从其他日志类型中查找UUID格式的计算ID（过滤掉对话ID本身）
+                if content.count('-') >= 4:
+                    for match in _UUID_RE.findall(content):
+                        if match != conversation_id:
+                            calc_ids[match] = None
             
-            # 去重并返回
-            return list(set(calc_ids))
+            return list(calc_ids)
             
         except Exception as e:
             self.system_log(f"提取计算ID时出错: {str(e)}")
             return []
 
-    def _run_crew_kickoff_thread(self, crew, result_container: Dict[str, Any], conversation_id: str) -> None:
-        """在独立线程中执行 crew.kickoff 并记录线程ID与结果。"""
+    @staticmethod
+    def _parse_calc_ids_from_json(content: str) -> List[str]:
+        """快速扫描未命中时的回退：解析内容中的JSON对象，再退回正则匹配"""
+        start, end = content.find('{'), content.rfind('}')
+        if start != -1 and end > start:
+            try:
+                tool_data = json.loads(content[start:end + 1])
+            except ValueError:
+                tool_data = None
+            if isinstance(tool_data, dict):
+                found = [tool_data['calculation_id']] if 'calculation_id' in tool_data else []
+                # 同一次遍历中检查嵌套结构中的calculation_id
+                found.extend(cid for value in tool_data.values()
+                             if isinstance(value, dict) and (cid := value.get('calculation_id')))
+                return found
+        found = []
+        for pattern in _CALC_ID_RES:
+            found.extend(pattern.findall(content))
+        return found
+
+    def _run_crew_kickoff_thread(self, crew, result_container: Dict[str, Any], conversation_id: str,
+                                 loop: asyncio.AbstractEventLoop, done: asyncio.Future) -> None:
+        """在独立线程中执行 crew.kickoff 并记录线程ID与结果，结束时通知事件循环。"""
         self._crew_thread_ids[conversation_id] = threading.get_ident()
         try:
             result_container['result'] = crew.kickoff()
@@ -856,6 +1003,17 @@ class QuartCrewServer(CrewServer):
                 self._crew_thread_ids.pop(conversation_id, None)
             except Exception:
                 pass
+            try:
+                loop.call_soon_threadsafe(self._mark_future_done, done)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    @staticmethod
+    def _mark_future_done(done: asyncio.Future) -> None:
+        """在事件循环线程中完成 future（已完成则忽略）"""
+        if not done.done():
+            done.set_result(None)
 
     def _inject_exception_into_thread(self, thread_id: int, exc_type=SystemExit) -> bool:
         """向目标线程异步注入异常以尝试强制结束。
@@ -872,19 +1030,18 @@ class QuartCrewServer(CrewServer):
 
     async def _stop_and_join_crew_thread(self, conversation_id: str, timeout: float = 5.0) -> bool:
         """尝试强制结束并等待指定会话对应的 crew 执行线程退出。"""
-        thread = self._running_threads.get(conversation_id)
+        done = self._crew_done.get(conversation_id)
         thread_id = self._crew_thread_ids.get(conversation_id)
         stopped = False
         if thread_id is not None:
             stopped = self._inject_exception_into_thread(thread_id, SystemExit)
-            print(f"injected, result={stopped}")
-        print(f"result={stopped}")
-        if thread is not None and thread.is_alive():
-            loop = asyncio.get_event_loop()
-            start = loop.time()
-            while thread.is_alive() and (loop.time() - start) < timeout:
-                await asyncio.sleep(0.05)
-        self._running_threads.pop(conversation_id, None)
+            logger.debug("injected SystemExit into crew thread of %s, result=%s", conversation_id, stopped)
+        if done is not None and not done.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(done), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._crew_done.pop(conversation_id, None)
         self._crew_thread_ids.pop(conversation_id, None)
         return stopped
 
@@ -893,12 +1050,7 @@ class QuartCrewServer(CrewServer):
         async with self.task_semaphore:
             try:
                 # 更新任务状态
-                async with aiosqlite.connect(self.db_path) as conn:
-                    await conn.execute(
-                        'UPDATE task_executions SET status = ?, started_at = CURRENT_TIMESTAMP WHERE conversation_id = ?',
-                        ('running', conversation_id)
-                    )
-                    await conn.commit()
+                await self._update_task_state(conversation_id, 'running')
 
                 # 系统日志（直接按对话ID记录，fingerprint尚未生成）
                 timestamp = datetime.now().strftime("%H:%M:%S")
@@ -908,59 +1060,51 @@ class QuartCrewServer(CrewServer):
                 # 创建工作目录
                 local_dir = os.path.join(self.work_dir, conversation_id)
                 os.makedirs(local_dir, exist_ok=True)
-                old_cwd = os.getcwd()
-                os.chdir(local_dir)
                 
-                try:
-                    # 初始化并建立映射
-                    self.system_log("Initializing crew...")
-                    generator = VaspCrew(self.config)
-                    crew = generator.crew(local_dir)
-                    # 注册映射关系（先注册再记录日志，避免未映射时fingerprint为None）
-                    self._register_mapping(conversation_id, crew.fingerprint.uuid_str)
-                    self.system_log("Registered mapping", crew.fingerprint.uuid_str)
-                    self.system_log("Creating user task...", crew.fingerprint.uuid_str)
-                    
-                    # 创建任务
-                    task = Task(
-                        description=task_description,
-                        expected_output="A detailed report, including the execution process, calculation results, and the location of the drawn charts.",
-                        output_file=f'crew_output_{uuid.uuid4().hex[:8]}.md',
-                    )
-                    
-                    crew.tasks = [task]
-                    
-                    self.system_log("Starting task execution...", crew.fingerprint.uuid_str)
-                    # 在线程中执行同步 kickoff，便于后续强制停止
-                    result_container: Dict[str, Any] = {}
-                    thread = threading.Thread(
-                        target=self._run_crew_kickoff_thread,
-                        args=(crew, result_container, conversation_id),
-                        daemon=True,
-                        name=f"crew-kickoff-{conversation_id[:8]}"
-                    )
-                    self._running_threads[conversation_id] = thread
-                    thread.start()
-                    # 异步轮询等待线程结束
-                    while thread.is_alive():
-                        await asyncio.sleep(0.1)
-                    # 线程结束后获取结果或异常
-                    if 'error' in result_container:
-                        raise result_container['error']
-                    result = result_container.get('result')
-                    
-                    self.system_log("Task completed!", crew.fingerprint.uuid_str)
-                    self.agent_output("FinalResult", str(result), crew.fingerprint.uuid_str)
-                    
-                    # 更新任务状态
-                    async with aiosqlite.connect(self.db_path) as conn:
-                        await conn.execute(
-                            'UPDATE task_executions SET status = ?, completed_at = CURRENT_TIMESTAMP, result = ? WHERE conversation_id = ?',
-                            ('completed', str(result), conversation_id)
-                        )
-                        await conn.commit()
-                finally:
-                    os.chdir(old_cwd)
+                # 初始化并建立映射
+                self.system_log("Initializing crew...")
+                generator = VaspCrew(self.config)
+                crew = generator.crew(local_dir)
+                # 注册映射关系（先注册再记录日志，避免未映射时fingerprint为None）
+                self._register_mapping(conversation_id, crew.fingerprint.uuid_str)
+                self.system_log("Registered mapping", crew.fingerprint.uuid_str)
+                self.system_log("Creating user task...", crew.fingerprint.uuid_str)
+                
+                # 创建任务
+                task = Task(
+                    description=task_description,
+                    expected_output="A detailed report, including the execution process, calculation results, and the location of the drawn charts.",
+                    output_file=os.path.join(local_dir, f'crew_output_{next(self._output_counter):08x}.md'),
+                )
+                
+                crew.tasks = [task]
+                
+                self.system_log("Starting task execution...", crew.fingerprint.uuid_str)
+                # 在线程中执行同步 kickoff，便于后续强制停止
+                result_container: Dict[str, Any] = {}
+                loop = asyncio.get_running_loop()
+                done = loop.create_future()
+                thread = threading.Thread(
+                    target=self._run_crew_kickoff_thread,
+                    args=(crew, result_container, conversation_id, loop, done),
+                    daemon=True,
+                    name=f"crew-kickoff-{conversation_id[:8]}"
+                )
+                self._crew_done[conversation_id] = done
+                thread.start()
+                # 等待线程结束（线程退出时回调唤醒，无需轮询）；shield 保证取消任务时 future 仍可供停止流程等待
+                await asyncio.shield(done)
+                self._crew_done.pop(conversation_id, None)
+                # 线程结束后获取结果或异常
+                if 'error' in result_container:
+                    raise result_container['error']
+                result = result_container.get('result')
+                
+                self.system_log("Task completed!", crew.fingerprint.uuid_str)
+                self.agent_output("FinalResult", str(result), crew.fingerprint.uuid_str)
+                
+                # 更新任务状态
+                await self._update_task_state(conversation_id, 'completed', result=str(result))
                          
             except asyncio.CancelledError:
                 # 任务被取消
@@ -975,23 +1119,13 @@ class QuartCrewServer(CrewServer):
                         generator.stop()
                 except Exception:
                     pass
-                async with aiosqlite.connect(self.db_path) as conn:
-                    await conn.execute(
-                        'UPDATE task_executions SET status = ?, completed_at = CURRENT_TIMESTAMP, error_message = ? WHERE conversation_id = ?',
-                        ('cancelled', 'Task cancelled', conversation_id)
-                    )
-                    await conn.commit()
+                await self._update_task_state(conversation_id, 'cancelled', error_message='Task cancelled')
                 raise
             except Exception as e:
                 error_msg = f"Error occurred during execution: {str(e)}"
                 
                 # 记录错误
-                async with aiosqlite.connect(self.db_path) as conn:
-                    await conn.execute(
-                        'UPDATE task_executions SET status = ?, completed_at = CURRENT_TIMESTAMP, error_message = ? WHERE conversation_id = ?',
-                        ('failed', error_msg, conversation_id)
-                    )
-                    await conn.commit()
+                await self._update_task_state(conversation_id, 'failed', error_message=error_msg)
                 
                 # 根据映射记录错误日志
                 fingerprint = self._conversation_to_fingerprint.get(conversation_id)
@@ -1043,74 +1177,228 @@ class QuartCrewServer(CrewServer):
 
     def tool_input(self, tool_name: str, message: Any, crew_fingerprint: str = None):
         """实现同步Tool输入方法（内部异步写库）"""
-        if isinstance(message, (dict, list)):
-            log_content = json.dumps(message, ensure_ascii=False)
-        else:
-            try:
-                parsed = json.loads(str(message))
-                log_content = json.dumps(parsed, ensure_ascii=False)
-            except Exception:
-                log_content = json.dumps({"raw": str(message)}, ensure_ascii=False)
+        log_content = _to_json_log_content(message)
         conversation_id = self._get_conversation_id_for_fingerprint(crew_fingerprint) if crew_fingerprint else None
         if conversation_id:
             self._schedule_log_to_db(conversation_id, 'tool_input', log_content, role_name=tool_name)
 
     def tool_output(self, tool_name: str, message: Any, crew_fingerprint: str = None):
         """实现同步Tool输出方法（内部异步写库）"""
-        if isinstance(message, (dict, list)):
-            log_content = json.dumps(message, ensure_ascii=False)
-        else:
-            try:
-                parsed = json.loads(str(message))
-                log_content = json.dumps(parsed, ensure_ascii=False)
-            except Exception:
-                log_content = json.dumps({"raw": str(message)}, ensure_ascii=False)
+        log_content = _to_json_log_content(message)
         conversation_id = self._get_conversation_id_for_fingerprint(crew_fingerprint) if crew_fingerprint else None
         if conversation_id:
             self._schedule_log_to_db(conversation_id, 'tool_output', log_content, role_name=tool_name)
 
     def _schedule_log_to_db(self, conversation_id, log_type, content, role_name=None):
-        """在事件循环中调度异步写库任务；若无事件循环则开线程执行。"""
-        try:
-            loop = asyncio.get_running_loop()
-            loop.create_task(self._log_to_db_async(conversation_id, log_type, content, role_name))
-        except RuntimeError:
-            t = threading.Thread(target=lambda: asyncio.run(self._log_to_db_async(conversation_id, log_type, content, role_name)))
-            t.daemon = True
-            t.start()
+        """
+        将日志追加到缓冲区，由后台写入任务批量写库；可在任意线程调用。
+        
+        缓冲区达到上限时，工作线程阻塞等待写入任务腾出空间；事件循环线程不能阻塞，直接追加。
+        """
+        buffer = self._log_buffer
+        if log_type == 'system' and len(buffer) >= self._log_buffer_high_water:
+            self._count_dropped_logs(1)
+            return
+        if len(buffer) >= self._log_buffer_limit and not _in_event_loop():
+            with self._log_space:
+                while (len(buffer) >= self._log_buffer_limit
+                       and self._log_writer is not None and not self._log_stopping):
+                    self._log_space.wait(timeout=1.0)
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        buffer.append((conversation_id, log_type, role_name, content, timestamp))
+
+    def _count_dropped_logs(self, count: int) -> None:
+        """累计丢弃的日志条数，首次丢弃及之后每一万条记录一次警告"""
+        with self._log_space:
+            before = self._log_dropped
+            self._log_dropped += count
+            total = self._log_dropped
+        if before == 0 or before // 10_000 != total // 10_000:
+            logger.warning("日志写入积压或失败，已丢弃 %d 条日志", total)
 
     def _register_mapping(self, conversation_id: str, crew_fingerprint: str) -> None:
-        """注册 conversation_id 与 crew_fingerprint 映射。"""
-        print(f"[Mapping] register {conversation_id} -> {crew_fingerprint}")
+        """注册 conversation_id 与 crew_fingerprint 映射（复制后整体替换，读取方无需加锁）。"""
+        logger.debug("[Mapping] register %s -> %s", conversation_id, crew_fingerprint)
         with self._mapping_lock:
-            self._conversation_to_fingerprint[conversation_id] = crew_fingerprint
-            self._fingerprint_to_conversation[crew_fingerprint] = conversation_id
-        print(f"[Mapping] size conv2fp={len(self._conversation_to_fingerprint)}, fp2conv={len(self._fingerprint_to_conversation)}")
+            conv_to_fp = self._conversation_to_fingerprint.copy()
+            fp_to_conv = self._fingerprint_to_conversation.copy()
+            conv_to_fp[conversation_id] = crew_fingerprint
+            fp_to_conv[crew_fingerprint] = conversation_id
+            self._conversation_to_fingerprint = conv_to_fp
+            self._fingerprint_to_conversation = fp_to_conv
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[Mapping] size conv2fp=%d, fp2conv=%d",
+                         len(self._conversation_to_fingerprint), len(self._fingerprint_to_conversation))
 
     def _unregister_mapping_by_conversation(self, conversation_id: str) -> None:
-        """根据 conversation_id 解除映射。"""
+        """根据 conversation_id 解除映射（复制后整体替换）。"""
         with self._mapping_lock:
-            print(f"[Mapping] unregister by conversation {conversation_id}")
-            crew_fingerprint = self._conversation_to_fingerprint.pop(conversation_id, None)
+            logger.debug("[Mapping] unregister by conversation %s", conversation_id)
+            conv_to_fp = self._conversation_to_fingerprint.copy()
+            crew_fingerprint = conv_to_fp.pop(conversation_id, None)
             if crew_fingerprint:
-                self._fingerprint_to_conversation.pop(crew_fingerprint, None)
-        print(f"[Mapping] size conv2fp={len(self._conversation_to_fingerprint)}, fp2conv={len(self._fingerprint_to_conversation)}")
+                fp_to_conv = self._fingerprint_to_conversation.copy()
+                fp_to_conv.pop(crew_fingerprint, None)
+                self._fingerprint_to_conversation = fp_to_conv
+            self._conversation_to_fingerprint = conv_to_fp
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[Mapping] size conv2fp=%d, fp2conv=%d",
+                         len(self._conversation_to_fingerprint), len(self._fingerprint_to_conversation))
 
     def _get_conversation_id_for_fingerprint(self, crew_fingerprint: Optional[str]) -> Optional[str]:
-        """通过 crew_fingerprint 查找 conversation_id。"""
+        """通过 crew_fingerprint 查找 conversation_id（无锁读取当前快照）。"""
         if not crew_fingerprint:
             return None
-        with self._mapping_lock:
-            return self._fingerprint_to_conversation.get(crew_fingerprint)
-
-    async def _log_to_db_async(self, conversation_id, log_type, content, role_name=None):
-        """异步将日志记录到数据库"""
-        async with aiosqlite.connect(self.db_path) as conn:
-            await conn.execute(
-                'INSERT INTO activity_logs (conversation_id, type, role_name, content) VALUES (?, ?, ?, ?)',
-                (conversation_id, log_type, role_name, content)
-            )
-            await conn.commit()
+        return self._fingerprint_to_conversation.get(crew_fingerprint)
+
+    async def _open_db_connection(self) -> aiosqlite.Connection:
+        """打开一个长期持有的数据库连接（WAL模式，显式事务）"""
+        conn = await aiosqlite.connect(self.db_path, isolation_level=None)
+        await conn.execute('PRAGMA journal_mode=WAL')
+        await conn.execute('PRAGMA synchronous=NORMAL')
+        await conn.execute('PRAGMA busy_timeout=5000')
+        return conn
+
+    async def _execute_control(self, sql: str, params: tuple = ()) -> int:
+        """在共享控制连接上执行一条写语句（自动提交），返回受影响行数"""
+        if self._db is None:
+            # 服务未启动（后台任务未初始化）时退回临时连接
+            async with aiosqlite.connect(self.db_path) as conn:
+                cursor = await conn.execute(sql, params)
+                await conn.commit()
+                return cursor.rowcount
+        async with self._db_lock:
+            async with self._db.execute(sql, params) as cursor:
+                return cursor.rowcount
+
+    async def _update_task_state(self, conversation_id: str, status: str, **fields) -> None:
+        """记录任务状态变更；写入任务运行时与日志合并在同一事务中落库，否则立即写库。"""
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        # 每次生成新的字典，写入任务据此判断提交期间是否又有新的变更
+        state = dict(self._task_state.get(conversation_id, {}))
+        state.update(fields, status=status)
+        state['started_at' if status == TaskStatus.RUNNING.value else 'completed_at'] = now
+        if self._log_writer is None:
+            await self._execute_control(_TASK_UPDATE_SQL, self._task_update_params(conversation_id, state))
+            return
+        self._task_state[conversation_id] = state
+
+    @staticmethod
+    def _task_update_params(conversation_id: str, state: Dict[str, Any]) -> tuple:
+        """生成 _TASK_UPDATE_SQL 的参数"""
+        return (state['status'], state.get('started_at'), state.get('completed_at'),
+                state.get('result'), state.get('error_message'), conversation_id)
+
+    async def _write_log_rows(self, rows: List[tuple], task_updates: Dict[str, Dict[str, Any]]) -> None:
+        """在单个事务中批量写入日志与任务状态变更"""
+        # 大批量时按多行 VALUES 拼接成整块语句，剩余不足一块的部分用 executemany
+        chunk = _LOG_ROWS_PER_STATEMENT
+        n_full = len(rows) // chunk * chunk
+        await self._log_conn.execute('BEGIN IMMEDIATE')
+        try:
+            for start in range(0, n_full, chunk):
+                params = [value for row in rows[start:start + chunk] for value in row]
+                await self._log_conn.execute(_LOG_MULTI_INSERT_SQL, params)
+            if n_full < len(rows):
+                await self._log_conn.executemany(_LOG_INSERT_SQL, rows[n_full:])
+            if task_updates:
+                await self._log_conn.executemany(
+                    _TASK_UPDATE_SQL,
+                    [self._task_update_params(cid, state) for cid, state in task_updates.items()]
+                )
+            await self._log_conn.execute('COMMIT')
+        except BaseException:
+            await self._log_conn.execute('ROLLBACK')
+            raise
+
+    async def _log_writer_loop(self):
+        """后台日志写入任务：定期取出缓冲区中积压的日志与待落库的任务状态，合并为一个事务提交；停止时写完剩余内容后退出。"""
+        buffer = self._log_buffer
+        attempts = 0  # 当前批次已失败的次数
+        failures = 0  # 连续失败次数，决定退避时间
+        while True:
+            if not buffer and not self._task_state:
+                if self._log_stopping:
+                    break
+                await asyncio.sleep(self._log_flush_interval)
+                continue
+            rows = []
+            while buffer and len(rows) < self._log_batch_size:
+                rows.append(buffer.popleft())
+            task_updates = dict(self._task_state)
+            try:
+                await self._write_log_rows(rows, task_updates)
+            except Exception as e:
+                if self._log_stopping:
+                    logger.error("批量写入日志失败（%d 条），丢弃剩余日志: %s", len(rows), e)
+                    self._count_dropped_logs(len(rows) + len(buffer))
+                    buffer.clear()
+                    break
+                failures += 1
+                if attempts < self._log_max_retries:
+                    # 失败的日志放回缓冲区头部，状态变更保留在内存中，随下一批按原顺序重试
+                    attempts += 1
+                    logger.warning("批量写入日志失败（%d 条），稍后重试: %s", len(rows), e)
+                    buffer.extendleft(reversed(rows))
+                else:
+                    # 重试后仍失败：逐条写入，只丢弃写不进去的日志，避免个别坏数据阻塞后续所有日志
+                    attempts = 0
+                    dropped = 0
+                    for row in rows:
+                        try:
+                            await self._write_log_rows([row], {})
+                        except Exception:
+                            dropped += 1
+                    if dropped:
+                        logger.error("批量写入日志重试后仍失败，丢弃 %d/%d 条: %s", dropped, len(rows), e)
+                        self._count_dropped_logs(dropped)
+                    with self._log_space:
+                        self._log_space.notify_all()
+                await asyncio.sleep(min(self._log_flush_interval * 2 ** min(failures, 10), self._log_max_backoff))
+                continue
+            attempts = failures = 0
+            if len(buffer) < self._log_buffer_limit:
+                with self._log_space:
+                    self._log_space.notify_all()
+            # 只移除提交期间未再变更的状态
+            for cid, state in task_updates.items():
+                if self._task_state.get(cid) is state:
+                    del self._task_state[cid]
+
+    async def _start_background_tasks(self):
+        """启动后台任务：打开控制连接，启动数据库计数同步与日志批量写入"""
+        self._log_stopping = False
+        self._db = await self._open_db_connection()
+        self._db_counts_task = asyncio.create_task(self._sync_db_counts_loop())
+        self._log_conn = await self._open_db_connection()
+        self._log_writer = asyncio.create_task(self._log_writer_loop())
+
+    async def _stop_background_tasks(self):
+        """停止后台任务：写完缓冲区中剩余日志后关闭连接"""
+        if self._db_counts_task is not None:
+            self._db_counts_task.cancel()
+            self._db_counts_task = None
+        if self._log_writer is not None:
+            self._log_stopping = True
+            with self._log_space:
+                self._log_space.notify_all()
+            await self._log_writer
+            self._log_writer = None
+        if self._log_dropped:
+            logger.warning("本次运行共丢弃 %d 条日志", self._log_dropped)
+        # 写入任务退出后残留的状态变更直接落库
+        for cid, state in list(self._task_state.items()):
+            try:
+                await self._execute_control(_TASK_UPDATE_SQL, self._task_update_params(cid, state))
+            except Exception as e:
+                print(f"❌ 写入任务状态失败 ({cid}): {str(e)}")
+        self._task_state.clear()
+        if self._log_conn is not None:
+            await self._log_conn.close()
+            self._log_conn = None
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
 
     async def _cancel_slurm_job(self, calc_ids: list[str]):
         """异步取消SLURM任务"""
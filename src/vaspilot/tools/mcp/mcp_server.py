@@ -1,20 +1,165 @@
 import os
+import copy
+import math
+import time
+import asyncio
 from pathlib import Path
-from typing import Dict, Any, Optional, List, Union
-from .python_plot import safe_execute_plot_code
-import uuid
+from typing import Dict, Any, Optional, List, Union, TYPE_CHECKING
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from fastmcp import FastMCP, Context
 from pymatgen.core import Structure
 from pymatgen.io.vasp import Kpoints
-from ase.dft.kpoints import BandPath
 import yaml
-import math
+try:
+    # 优先使用libyaml的C实现
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
 import numpy as np
-import pickle
-from .vasp_calculate import vasp_relaxation, vasp_scf, vasp_nscf, check_status, cancel_slurm_job
-from .struct_tools import search_materials_project, analyze_crystal_structure, create_crystal_structure, make_supercell, rotate_structure, symmetrize_structure
+from .vasp_calculate import vasp_relaxation, vasp_scf, vasp_nscf, vasp_submit_batch, check_status, cancel_slurm_jobs, wait_for_slurm_change
 from pydantic import BaseModel, Field
 from .sqlite_database import VaspCalculationDB
+
+# 绘图（matplotlib/pandas）、结构工具（mp_api）和k点路径相关模块较重，在首次使用时才导入
+if TYPE_CHECKING:
+    from ase.dft.kpoints import BandPath
+    from pymatgen.symmetry.bandstructure import HighSymmKpath
+
+# 提交类工具返回给LLM的字段
+_SUBMIT_KEYS = ("calculation_id", "slurm_id", "success", "error", "status", "calculate_path")
+# 计算结果返回给LLM的通用字段和按计算类型附加的字段
+_LLM_BASE_KEYS = ("status", "error", "slurm_id", "calculate_path", "calc_type")
+_LLM_EXTRA_KEYS = {
+    "relaxation": ("total_energy", "max_force", "stress", "ionic_steps"),
+    "scf": ("total_energy", "efermi", "band_gap", "is_metal"),
+    "nscf": ("efermi", "band_gap", "is_metal"),
+}
+
+# 仍需向SLURM查询状态的任务状态，其余状态视为已结束
+_ACTIVE_STATUSES = frozenset({"submitted", "pending", "running", "unknown", None})
+# 同一任务在该时间（秒）内重复查询时直接返回数据库中的状态，不再访问SLURM
+_STATUS_POLL_TTL = 10.0
+# SLURM任务ID到上次查询时间（time.monotonic）的映射
+_last_polled: Dict[str, float] = {}
+
+# 可以用scancel取消的任务状态
+_CANCELLABLE_STATUSES = frozenset({"submitted", "pending", "running"})
+
+# 状态写回时按对象身份判断是否变化的大对象字段（解析结果缓存会复用同一对象）；其余字段按值比较
+_IDENTITY_COMPARED_FIELDS = frozenset({"structure", "band_structure", "dos", "eigenvalues", "eigen_values", "cbm", "vbm"})
+
+def _field_changed(key: str, old: Any, new: Any) -> bool:
+    """判断状态写回时某字段是否变化"""
+    if old is new:
+        return False
+    if key in _IDENTITY_COMPARED_FIELDS:
+        return True
+    try:
+        return bool(old != new)
+    except (TypeError, ValueError):
+        # NumPy数组等无法直接得到布尔值的比较结果，视为已变化
+        return True
+
+def _read_structure(path: str) -> Structure:
+    """读取结构文件（与结构工具共用 struct_tools.load_structure 的解析缓存），格式由pymatgen按文件名判断"""
+    from .struct_tools import load_structure
+    return load_structure(path, default_fmt=None)
+
+def _auto_kgrid(lattice, density: float = 40) -> tuple[int, int, int]:
+    """按k点密度自动生成Gamma中心网格：n_i = ceil(density * (abc/V)^(1/3) / a_i)，至少为1"""
+    # 单个晶格只是三个标量，纯Python运算比NumPy的调度开销更小
+    a, b, c = lattice.abc
+    factor = density * (a * b * c / lattice.volume) ** (1 / 3)
+    return (max(math.ceil(factor / a), 1), max(math.ceil(factor / b), 1), max(math.ceil(factor / c), 1))
+
+def _new_calculation_id() -> str:
+    """
+    生成随机的计算ID（UUID4的标准带连字符格式）
+    
+    直接由随机字节格式化，不构造 uuid.UUID 对象；前端按UUID格式从日志中提取计算ID，格式不能改变。
+    """
+    b = bytearray(os.urandom(16))
+    b[6] = (b[6] & 0x0F) | 0x40  # 版本号 4
+    b[8] = (b[8] & 0x3F) | 0x80  # RFC 4122 变体
+    h = b.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+def _check_paths_exist(file_paths: list[str]) -> Dict[str, bool]:
+    """批量检查路径是否存在：同一目录下有多个路径时只列一次目录"""
+    groups = {}
+    for path in file_paths:
+        groups.setdefault(os.path.dirname(path) or ".", []).append(path)
+    
+    result = {}
+    for directory, paths in groups.items():
+        names = [os.path.basename(path) for path in paths]
+        if len(paths) < 2 or any(name in ("", ".", "..") for name in names):
+            for path in paths:
+                result[path] = os.path.exists(path)
+            continue
+        try:
+            with os.scandir(directory) as it:
+                # 与 os.path.exists 一致，失效的符号链接视为不存在
+                present = {entry.name for entry in it if not entry.is_symlink() or os.path.exists(entry.path)}
+        except OSError:
+            present = set()
+        for path, name in zip(paths, names):
+            result[path] = name in present
+    return {path: result[path] for path in file_paths}
+
+def _auto_kgrid_batch(lattices: list, density: float = 40) -> list[tuple[int, int, int]]:
+    """批量计算自动k点网格，规则与 _auto_kgrid 相同"""
+    if not lattices:
+        return []
+    abc = np.array([lattice.abc for lattice in lattices])
+    volumes = np.array([lattice.volume for lattice in lattices])
+    factor = density * np.cbrt(abc.prod(axis=1) / volumes)
+    grids = np.maximum(np.ceil(factor[:, None] / abc), 1).astype(int)
+    return [tuple(int(n) for n in row) for row in grids]
+
+@lru_cache(maxsize=8)
+def _load_settings_cached(path: str, mtime_ns: int, size: int) -> dict:
+    """解析YAML配置（按路径、修改时间和大小缓存）"""
+    with open(path, "r") as f:
+        return yaml.load(f, Loader=_YamlLoader)
+
+def _load_settings(path: str) -> dict:
+    """读取配置文件，返回副本避免修改缓存"""
+    st = os.stat(path)
+    return copy.deepcopy(_load_settings_cached(os.path.abspath(path), st.st_mtime_ns, st.st_size))
+
+# 批量提交时解析结构和提交任务的最大线程数
+_BULK_MAX_WORKERS = 16
+
+_kpath_cache: "OrderedDict[bytes, HighSymmKpath]" = OrderedDict()
+_kpath_cache_lock = threading.Lock()
+_KPATH_CACHE_SIZE = 64
+
+def _high_symm_kpath(struct: Structure) -> "HighSymmKpath":
+    """获取结构的高对称k点路径，按晶格、分数坐标和元素缓存，避免重复做对称性分析"""
+    key = hashlib.blake2b(
+        np.ascontiguousarray(struct.lattice.matrix).tobytes()
+        + np.ascontiguousarray(struct.frac_coords).tobytes()
+        + ",".join(str(sp) for sp in struct.species).encode(),
+        digest_size=16
+    ).digest()
+    with _kpath_cache_lock:
+        kpath_obj = _kpath_cache.get(key)
+        if kpath_obj is not None:
+            _kpath_cache.move_to_end(key)
+            return kpath_obj
+    from pymatgen.symmetry.bandstructure import HighSymmKpath
+    kpath_obj = HighSymmKpath(struct)
+    with _kpath_cache_lock:
+        _kpath_cache[key] = kpath_obj
+        if len(_kpath_cache) > _KPATH_CACHE_SIZE:
+            _kpath_cache.popitem(last=False)
+    return kpath_obj
+
 def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
     
     # 加载配置文件
@@ -23,13 +168,17 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
         project_root = current_dir.parent.parent.parent.parent
         config_path = f"{project_root}/configs/mcp_config.yaml"
     
-    with open(config_path, "r") as f:
-        settings = yaml.safe_load(f)
+    settings = _load_settings(config_path)
 
     db_path = settings['db_path']
     attachment_path = settings['attachment_path']
     mp_api_key = settings['mp_api_key']
     structure_path = settings['structure_path']
+    # 默认INCAR在启动时取出，配置缺项时立即报错而不是等到提交任务
+    default_incar = settings['VASP_default_INCAR']
+    incar_relax = dict(default_incar['relaxation'])
+    incar_scf = {True: dict(default_incar['scf_soc']), False: dict(default_incar['scf_nsoc'])}
+    incar_nscf = {True: dict(default_incar['nscf_soc']), False: dict(default_incar['nscf_nsoc'])}
 
     # 初始化SQLite数据库
     db = VaspCalculationDB(db_path=db_path)
@@ -47,45 +196,23 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
 
     def extract_calculation_data(calculation_ids: List[str]) -> Dict[str, Any]:
         """从计算记录中提取数据"""
-        data = {}
-        for calc_id in calculation_ids:
-            record = read_record(calc_id)
-            if record is not None:
-                data[calc_id] = record
-            else:
-                data[calc_id] = None
-        return data
+        records = db.read_records_bulk(calculation_ids)
+        # 画图代码可能原地修改对象，深拷贝以免污染数据库缓存
+        return {calc_id: copy.deepcopy(records[calc_id]) for calc_id in calculation_ids if calc_id in records}
 
     def extract_llm_friendly_result(data: Dict[str, Any]) -> Dict[str, Any]:
-        llm_friendly_result = {}
-        llm_friendly_result = {
-            "status": data.get("status", "unknown"),
-            "error": data.get("error"),
-            "slurm_id": data.get("slurm_id"),
-            "calculate_path": data.get("calculate_path"),
-            "calc_type": data.get("calc_type"),
-        }
-        if data.get("calc_type") == "relaxation":
-            llm_friendly_result.update({
-                "total_energy": data.get("total_energy"),
-                "max_force": data.get("max_force"),
-                "stress": data.get("stress"),
-                "ionic_steps": data.get("ionic_steps")
-            })
-        elif data.get("calc_type") == "scf":
-            llm_friendly_result.update({
-                "total_energy": data.get("total_energy"),
-                "efermi": data.get("efermi"),
-                "band_gap": data.get("band_gap"),
-                "is_metal": data.get("is_metal")
-            })
-        elif data.get("calc_type") == "nscf":
-                llm_friendly_result.update({
-                    "efermi": data.get("efermi"),
-                    "band_gap": data.get("band_gap"),
-                    "is_metal": data.get("is_metal")
-                })
+        calc_type = data.get("calc_type")
+        llm_friendly_result = {key: data.get(key) for key in _LLM_BASE_KEYS}
+        llm_friendly_result["status"] = data.get("status", "unknown")
+        for key in _LLM_EXTRA_KEYS.get(calc_type, ()):
+            llm_friendly_result[key] = data.get(key)
+        if calc_type == "nscf":
+            # 带边只返回能量，k点等对象留在数据库中供绘图使用
+            for key in ("cbm", "vbm"):
+                edge = data.get(key)
+                llm_friendly_result[f"{key}_energy"] = edge.get("energy") if isinstance(edge, dict) else None
         return llm_friendly_result
+
     @mcp.tool(name="vasp_relaxation")
     async def vasp_relaxation_tool(structure_path: str, incar_tags: Optional[Dict] = None, kpoint_num: Optional[tuple[int, int, int]] = None, potcar_map: Optional[Dict] = None) -> Dict[str, Any]:
         """
@@ -107,20 +234,16 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
         # 转换输入参数
         
         # 生成随机UUID
-        calculation_id = str(uuid.uuid4())
-        struct = Structure.from_file(structure_path)
+        calculation_id = _new_calculation_id()
+        struct = await asyncio.to_thread(_read_structure, structure_path)
         if kpoint_num is None:
-            factor = 40 * np.power(struct.lattice.a * struct.lattice.b * struct.lattice.c / struct.lattice.volume , 1/3)
-            kpoint_float = (factor/struct.lattice.a, factor/struct.lattice.b, factor/struct.lattice.c)
-            kpoint_num = (max(math.ceil(kpoint_float[0]), 1), max(math.ceil(kpoint_float[1]), 1), max(math.ceil(kpoint_float[2]), 1))
+            kpoint_num = _auto_kgrid(struct.lattice)
         kpts = Kpoints.gamma_automatic(kpts = kpoint_num)
-        incar = {}
-        incar.update(settings['VASP_default_INCAR']['relaxation'])
-        if incar_tags is not None:
-            incar.update(incar_tags)
+        incar = {**incar_relax, **(incar_tags or {})}
         
         # 执行计算
-        result = vasp_relaxation(
+        result = await asyncio.to_thread(
+            vasp_relaxation,
             calculation_id=calculation_id,
             work_dir=settings['work_dir'],
             struct=struct,
@@ -132,17 +255,85 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
         
         # 保存记录
         result['calculation_id'] = calculation_id
-        write_record(calculation_id, result)
-        
-        llm_friendly_result = {
-            'calculation_id': calculation_id,
-            'slurm_id': result['slurm_id'],
-            'success': result['success'],
-            'error': result['error'],
-            'status': result['status'],
-            'calculate_path': result['calculate_path']
-        }
-        return llm_friendly_result
+        await asyncio.to_thread(write_record, calculation_id, result)
+        
+        return {key: result[key] for key in _SUBMIT_KEYS}
+
+    @mcp.tool(name="vasp_relaxation_bulk")
+    async def vasp_relaxation_bulk_tool(structure_paths: List[str], incar_tags: Optional[Dict] = None, kpoint_num: Optional[tuple[int, int, int]] = None, potcar_map: Optional[Dict] = None) -> Dict[str, Any]:
+        """
+        Submit VASP structural relaxation jobs for many structures at once.
+        Prefer this over calling vasp_relaxation repeatedly when relaxing more than a few structures.
+        
+        Args:
+            structure_paths: Paths to the structure files (supports CIF, POSCAR, etc.).
+            incar_tags: Additional INCAR parameters applied to every job. Use None unless explicitly specified by the user.
+            kpoint_num: K-point mesh as a tuple (nx, ny, nz) used for every job. If not provided, an automatic density of 40 is used per structure.
+            potcar_map: POTCAR mapping as {element: potcar}, e.g., {"Bi": "Bi_d", "Se": "Se"}. Use None unless explicitly specified by the user.
+        Returns:
+            A dict mapping each structure path to its submission result with keys:
+            - calculation_id: Unique calculation identifier
+            - slurm_id: SLURM job ID
+            - success: Whether submission succeeded
+            - error: Error message, if any
+            - status: Job status ("pending"/"failed")
+        """
+        paths = list(dict.fromkeys(structure_paths))
+        incar = {**incar_relax, **(incar_tags or {})}
+        
+        def parse(path):
+            try:
+                return _read_structure(path)
+            except Exception as e:
+                return e
+        
+        def run_bulk():
+            with ThreadPoolExecutor(max_workers=_BULK_MAX_WORKERS) as ex:
+                parsed = list(ex.map(parse, paths))
+            
+            results = {}
+            jobs = []
+            for path, struct in zip(paths, parsed):
+                if isinstance(struct, Exception):
+                    results[path] = dict.fromkeys(_SUBMIT_KEYS)
+                    results[path].update(
+                        success=False,
+                        error=f"Failed to read structure: {struct}",
+                        status='failed'
+                    )
+                else:
+                    jobs.append((path, struct))
+            
+            if kpoint_num is None:
+                grids = _auto_kgrid_batch([struct.lattice for _, struct in jobs])
+            else:
+                grids = [kpoint_num] * len(jobs)
+            
+            calc_ids = [_new_calculation_id() for _ in jobs]
+            submitted = vasp_submit_batch([
+                {
+                    "calc_type": "relaxation",
+                    "calculation_id": calc_id,
+                    "work_dir": settings['work_dir'],
+                    "struct": struct,
+                    "kpoints": Kpoints.gamma_automatic(kpts=grid),
+                    "incar_dict": dict(incar),
+                    "attachment_path": attachment_path,
+                    "potcar_map": potcar_map,
+                }
+                for calc_id, (_, struct), grid in zip(calc_ids, jobs, grids)
+            ])
+            records = {}
+            for calc_id, (path, _), result in zip(calc_ids, jobs, submitted):
+                result['calculation_id'] = calc_id
+                records[calc_id] = result
+                results[path] = {key: result[key] for key in _SUBMIT_KEYS}
+            
+            # 在一个事务中保存所有记录
+            db.write_records_bulk(records)
+            return {path: results[path] for path in paths}
+        
+        return await asyncio.to_thread(run_bulk)
 
     @mcp.tool(name="vasp_scf")
     async def vasp_scf_tool(restart_id: Optional[str] = None, structure_path: Optional[str] = None, soc: bool=True, incar_tags: Optional[Dict] = None, kpoint_num: Optional[tuple[int, int, int]] = None, potcar_map: Optional[Dict] = None) -> Dict[str, Any]:
@@ -167,39 +358,33 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
         # 转换输入参数
         
         # 生成随机UUID
-        calculation_id = str(uuid.uuid4())
+        calculation_id = _new_calculation_id()
         if restart_id is not None:
-            restart_record = read_record(restart_id)
+            restart_record = await asyncio.to_thread(read_record, restart_id)
             if restart_record is None:
                 return {"success": False, "error": f"Restart record {restart_id} not found"}
             struct = restart_record['structure']
-            chgcar_path = os.path.join(restart_record['calculate_path'], "CHGCAR")
-            wavecar_path = os.path.join(restart_record['calculate_path'], "WAVECAR")
+            base = restart_record['calculate_path']
+            chgcar_path = f"{base}/CHGCAR"
+            wavecar_path = f"{base}/WAVECAR"
         else:
             if structure_path is None:
                 return {"success": False, "error": "structure_path is required when restart_id is not provided"}
             else:
                 try:
-                    struct = Structure.from_file(structure_path)
+                    struct = await asyncio.to_thread(_read_structure, structure_path)
                 except Exception as e:
                     return {"success": False, "error": f"Failed to read structure from {structure_path}: {e}"}
             chgcar_path = None
             wavecar_path = None
         if kpoint_num is None:
-            factor = 40 * np.power(struct.lattice.a * struct.lattice.b * struct.lattice.c / struct.lattice.volume , 1/3)
-            kpoint_float = (factor/struct.lattice.a, factor/struct.lattice.b, factor/struct.lattice.c)
-            kpoint_num = (max(math.ceil(kpoint_float[0]), 1), max(math.ceil(kpoint_float[1]), 1), max(math.ceil(kpoint_float[2]), 1))
+            kpoint_num = _auto_kgrid(struct.lattice)
         kpts = Kpoints.gamma_automatic(kpts = kpoint_num)
-        incar = {}
-        if soc:
-            incar.update(settings['VASP_default_INCAR']['scf_soc'])
-        else:
-            incar.update(settings['VASP_default_INCAR']['scf_nsoc'])
-        if incar_tags is not None:
-            incar.update(incar_tags)
+        incar = {**incar_scf[bool(soc)], **(incar_tags or {})}
         
         # 执行计算
-        result = vasp_scf(
+        result = await asyncio.to_thread(
+            vasp_scf,
             calculation_id=calculation_id,
             work_dir=settings['work_dir'],
             struct=struct,
@@ -216,17 +401,9 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
         result['soc'] = soc
         result['incar_tags'] = incar_tags
         result['restart_id'] = restart_id
-        write_record(calculation_id, result)
-        
-        llm_friendly_result = {
-            'calculation_id': calculation_id,
-            'slurm_id': result['slurm_id'],
-            'success': result['success'],
-            'error': result['error'],
-            'status': result['status'],
-            'calculate_path': result['calculate_path']
-        }
-        return llm_friendly_result
+        await asyncio.to_thread(write_record, calculation_id, result)
+        
+        return {key: result[key] for key in _SUBMIT_KEYS}
 
     @mcp.tool(name="vasp_nscf_kpath")
     async def vasp_nscf_kpath_tool(restart_id: str, soc: bool=True, incar_tags: Optional[Dict] = None, kpath: Optional[str] = None, n_kpoints: Optional[int] = None, potcar_map: Optional[Dict] = None) -> Dict[str, Any]:
@@ -252,41 +429,32 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
             - status: Job status ("pending"/"failed")
         """
         # 生成随机UUID
-        calculation_id = str(uuid.uuid4())
+        calculation_id = _new_calculation_id()
         
         # 获取结构和前序计算文件
-        scf_record = read_record(restart_id)
+        scf_record = await asyncio.to_thread(read_record, restart_id)
         if scf_record is None:
             return {"success": False, "error": f"SCF record {restart_id} not found"}
         struct: Structure = scf_record['structure']
-        chgcar_path = os.path.join(scf_record['calculate_path'], "CHGCAR")
-        wavecar_path = os.path.join(scf_record['calculate_path'], "WAVECAR")
+        base = scf_record['calculate_path']
+        chgcar_path = f"{base}/CHGCAR"
+        wavecar_path = f"{base}/WAVECAR"
         
         # 设置k点路径
-        from pymatgen.symmetry.bandstructure import HighSymmKpath
-        kpath_obj = HighSymmKpath(struct)
-        if kpath_obj.kpath is None:
-            return {"success": False, "error": "Failed to generate k-path for the structure"}
-
         n_kpoints = 16 if n_kpoints is None else n_kpoints
         if kpath is None:
-            # 使用pymatgen自动生成的高对称路径
+            # 使用pymatgen自动生成的高对称路径（只有这一分支需要对称性分析）
+            kpath_obj = await asyncio.to_thread(_high_symm_kpath, struct)
+            if kpath_obj.kpath is None:
+                return {"success": False, "error": "Failed to generate k-path for the structure"}
             kpts = Kpoints.automatic_linemode(n_kpoints, kpath_obj)
         else:
             # 使用用户指定的路径
             kpts_ase: BandPath = struct.to_ase_atoms().get_cell().bandpath(kpath, npoints=n_kpoints, eps=1e-2)
-            high_sym_points = []
-            labels = []
-            high_sym_points.append(kpts_ase.special_points[kpath[0]])
-            labels.append(kpath[0])
-            kpath_list = list(kpath)
-            for key in kpath_list[1:-1]:
-                high_sym_points.append(kpts_ase.special_points[key])
-                labels.append(key)
-                high_sym_points.append(kpts_ase.special_points[key])
-                labels.append(key)
-            high_sym_points.append(kpts_ase.special_points[kpath[-1]])
-            labels.append(kpath[-1])
+            # 线模式下中间点既是上一段终点也是下一段起点，除首尾外每个点重复两次
+            sp = kpts_ase.special_points
+            labels = [kpath[0]] + [key for key in kpath[1:-1] for _ in (0, 1)] + [kpath[-1]]
+            high_sym_points = [sp[key] for key in labels]
             kpts = Kpoints(
                 comment="User specified k-path",
                 style=Kpoints.supported_modes.Line_mode,
@@ -297,16 +465,11 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
             )
         
         # 设置INCAR
-        incar = {}
-        if soc:
-            incar.update(settings['VASP_default_INCAR']['nscf_soc'])
-        else:
-            incar.update(settings['VASP_default_INCAR']['nscf_nsoc'])
-        if incar_tags is not None:
-            incar.update(incar_tags)
+        incar = {**incar_nscf[bool(soc)], **(incar_tags or {})}
         
         # 执行计算
-        result = vasp_nscf(
+        result = await asyncio.to_thread(
+            vasp_nscf,
             calculation_id=calculation_id,
             work_dir=settings['work_dir'],
             struct=struct,
@@ -325,17 +488,9 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
         result['restart_id'] = restart_id
         result['kpath'] = kpath
         result['n_kpoints'] = n_kpoints
-        write_record(calculation_id, result)
-        
-        llm_friendly_result = {
-            'calculation_id': calculation_id,
-            'slurm_id': result['slurm_id'],
-            'success': result['success'],
-            'error': result['error'],
-            'status': result['status'],
-            'calculate_path': result['calculate_path']
-        }
-        return llm_friendly_result
+        await asyncio.to_thread(write_record, calculation_id, result)
+        
+        return {key: result[key] for key in _SUBMIT_KEYS}
 
     @mcp.tool(name="vasp_nscf_uniform")
     async def vasp_nscf_uniform_tool(restart_id: str, soc: bool=True, incar_tags: Optional[Dict] = None, kpoint_num: Optional[tuple[int, int, int]] = None, potcar_map: Optional[Dict] = None) -> Dict[str, Any]:
@@ -357,35 +512,29 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
             - status: Job status ("pending"/"failed")
         """
         # 生成随机UUID
-        calculation_id = str(uuid.uuid4())
+        calculation_id = _new_calculation_id()
         
         # 获取结构和前序计算文件
-        scf_record = read_record(restart_id)
+        scf_record = await asyncio.to_thread(read_record, restart_id)
         if scf_record is None:
             return {"success": False, "error": f"SCF record {restart_id} not found"}
         struct: Structure = scf_record['structure']
-        chgcar_path = os.path.join(scf_record['calculate_path'], "CHGCAR")
-        wavecar_path = os.path.join(scf_record['calculate_path'], "WAVECAR")
+        base = scf_record['calculate_path']
+        chgcar_path = f"{base}/CHGCAR"
+        wavecar_path = f"{base}/WAVECAR"
         
         # 设置k点
 
         if kpoint_num is None:
-            factor = 100 * np.power(struct.lattice.a * struct.lattice.b * struct.lattice.c / struct.lattice.volume , 1/3)
-            kpoint_float = (factor/struct.lattice.a, factor/struct.lattice.b, factor/struct.lattice.c)
-            kpoint_num = (max(math.ceil(kpoint_float[0]), 1), max(math.ceil(kpoint_float[1]), 1), max(math.ceil(kpoint_float[2]), 1))
+            kpoint_num = _auto_kgrid(struct.lattice, density=100)
         kpts = Kpoints.gamma_automatic(kpts = kpoint_num)
         
         # 设置INCAR
-        incar = {}
-        if soc:
-            incar.update(settings['VASP_default_INCAR']['nscf_soc'])
-        else:
-            incar.update(settings['VASP_default_INCAR']['nscf_nsoc'])
-        if incar_tags is not None:
-            incar.update(incar_tags)
+        incar = {**incar_nscf[bool(soc)], **(incar_tags or {})}
         
         # 执行计算
-        result = vasp_nscf(
+        result = await asyncio.to_thread(
+            vasp_nscf,
             calculation_id=calculation_id,
             work_dir=settings['work_dir'],
             struct=struct,
@@ -403,25 +552,19 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
         result['incar_tags'] = incar_tags
         result['restart_id'] = restart_id
         result['kpoint_num'] = kpoint_num
-        write_record(calculation_id, result)
-        
-        llm_friendly_result = {
-            'calculation_id': calculation_id,
-            'slurm_id': result['slurm_id'],
-            'success': result['success'],
-            'error': result['error'],
-            'status': result['status'],
-            'calculate_path': result['calculate_path']
-        }
-        return llm_friendly_result
+        await asyncio.to_thread(write_record, calculation_id, result)
+        
+        return {key: result[key] for key in _SUBMIT_KEYS}
 
     @mcp.tool(name="check_calculation_status")
-    async def check_calculation_status_tool(calculation_ids: List[str]) -> Dict[str, Any]:
+    async def check_calculation_status_tool(calculation_ids: List[str], wait_seconds: int = 0) -> Dict[str, Any]:
         """
         Check the status of calculation jobs and return results.
         
         Args:
             calculation_ids: List of calculation IDs to check
+            wait_seconds: If greater than 0 and all jobs are still queued/running, wait up to this many seconds
+                (capped at 300) for any of them to change state before returning. Use 0 for an immediate answer.
         
         Returns:
             A dict mapping each calculation_id to the following structure:
@@ -439,19 +582,50 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
         calc_dict = {}
         llm_friendly_result = {}
         
-        # 收集有效的计算记录
-        for calc_id in calculation_ids:
-            record = read_record(calc_id)
-            if record is not None:
-                calc_dict[calc_id] = record
-        
-        # 对有记录的计算检查SLURM状态
-        if calc_dict:
-            updated_results = check_status(calc_dict)
-            # 更新记录
-            for calc_id, result in updated_results.items():
-                write_record(calc_id, result)
-                calc_dict[calc_id] = result
+        # 一次查询收集有效的计算记录
+        calc_dict.update(await asyncio.to_thread(db.read_records_bulk, calculation_ids))
+        
+        async def refresh_status():
+            # 只对尚未结束的任务查询SLURM，已结束的任务直接返回数据库中的结果
+            # 刚查询过的任务也跳过，避免短时间内的重复调用反复访问SLURM
+            now = time.monotonic()
+            active = {
+                k: v for k, v in calc_dict.items()
+                if v.get("status") in _ACTIVE_STATUSES
+                and now - _last_polled.get(str(v.get("slurm_id")), float("-inf")) >= _STATUS_POLL_TTL
+            }
+            if not active:
+                return
+            before = {calc_id: dict(data) for calc_id, data in active.items()}
+            updated_results = await asyncio.to_thread(check_status, active)
+            polled_at = time.monotonic()
+            for slurm_id in list(_last_polled):
+                if polled_at - _last_polled[slurm_id] >= _STATUS_POLL_TTL:
+                    del _last_polled[slurm_id]
+            for data in updated_results.values():
+                if data.get("status") in _ACTIVE_STATUSES:
+                    _last_polled[str(data.get("slurm_id"))] = polled_at
+            # 只写回发生变化的字段，避免每次轮询都重新序列化结构等大对象
+            changes = {}
+            for calc_id, data in updated_results.items():
+                old = before.get(calc_id, {})
+                changed = {key: value for key, value in data.items() if _field_changed(key, old.get(key), value)}
+                if changed:
+                    changes[calc_id] = changed
+            await asyncio.to_thread(db.update_records_fields, changes)
+            calc_dict.update(updated_results)
+        
+        # 先按当前状态查询一次，已有任务结束时立即返回
+        await refresh_status()
+        
+        # 长轮询：所有任务都仍未结束时，在事件循环中等待队列状态变化（不占用线程），变化后再查询一次
+        if wait_seconds > 0 and calc_dict and all(v.get("status") in _ACTIVE_STATUSES for v in calc_dict.values()):
+            slurm_ids = [v.get("slurm_id") for v in calc_dict.values()]
+            if await wait_for_slurm_change(slurm_ids, min(wait_seconds, 300)):
+                # 检测到变化，跳过TTL立即查询
+                for slurm_id in slurm_ids:
+                    _last_polled.pop(str(slurm_id), None)
+                await refresh_status()
         
         # 为所有计算ID构建返回结果
         for calc_id in calculation_ids:
@@ -576,10 +750,8 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
             - calculation_data_summary: Summary of the data used
         """
         
-        # 提取计算数据
-        calculation_data = extract_calculation_data(calculation_ids)
-        # 检查是否有有效的计算数据
-        valid_data = {k: v for k, v in calculation_data.items() if v is not None}
+        # 提取计算数据（只包含存在的记录）
+        valid_data = await asyncio.to_thread(extract_calculation_data, calculation_ids)
         if not valid_data:
             return {
                 'success': False,
@@ -602,6 +774,7 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
                 data_summary[calc_id] = summary
         
         # 执行画图代码
+        from .python_plot import safe_execute_plot_code
         success, result, image_base64 = safe_execute_plot_code(plot_code, valid_data, settings['work_dir'])
         if success:
             return {
@@ -639,7 +812,8 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
         Returns:
             Dict with search results and download status
         """
-        result = search_materials_project(api_key=mp_api_key, search_criteria=search_criteria, download_path=structure_path, limit=limit)
+        from .struct_tools import search_materials_project
+        result = await asyncio.to_thread(search_materials_project, api_key=mp_api_key, search_criteria=search_criteria, download_path=structure_path, limit=limit)
         return result
 
     @mcp.tool(name="analyze_crystal_structure")
@@ -648,7 +822,8 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
         Args:
             struct_path: Structure input; can be a file path or a pymatgen Structure object
         """
-        return analyze_crystal_structure(struct_path)
+        from .struct_tools import analyze_crystal_structure
+        return await asyncio.to_thread(analyze_crystal_structure, struct_path)
 
     @mcp.tool(name="create_crystal_structure")
     async def create_crystal_structure_tool(positions: List[List[float]], elements: List[str], lattice_vectors: List[List[float]], cartesian: bool) -> Dict[str, Any]:
@@ -662,7 +837,8 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
         Returns:
             Dict containing the path to the created structure file
         """
-        return create_crystal_structure(np.array(positions), elements, np.array(lattice_vectors), cartesian, structure_path)
+        from .struct_tools import create_crystal_structure
+        return await asyncio.to_thread(create_crystal_structure, np.asarray(positions, dtype=np.float64), elements, np.asarray(lattice_vectors, dtype=np.float64), cartesian, structure_path)
 
     @mcp.tool(name="make_supercell")
     async def make_supercell_tool(struct_path: str, supercell_matrix: List[List[int]]) -> Dict[str, Any]:
@@ -670,7 +846,8 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
         Args:
             struct_path: Structure input; can be a file path or a pymatgen Structure object
         """
-        return make_supercell(struct_path, supercell_matrix)
+        from .struct_tools import make_supercell
+        return await asyncio.to_thread(make_supercell, struct_path, supercell_matrix)
 
     @mcp.tool(name="symmetrize_structure")
     async def symmetrize_structure_tool(struct_path: str) -> Dict[str, Any]:
@@ -678,7 +855,8 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
         Args:
             struct_path: Structure input; can be a file path or a pymatgen Structure object
         """
-        return symmetrize_structure(struct_path)
+        from .struct_tools import symmetrize_structure
+        return await asyncio.to_thread(symmetrize_structure, struct_path)
 
     @mcp.tool(name="list_calculations")
     async def list_calculations_tool(calc_type: Optional[str] = None, status: Optional[str] = None, limit: Optional[int] = 50) -> Dict[str, Any]:
@@ -694,7 +872,7 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
             result_dict: A dict containing the list of records
         """
         try:
-            calculations = db.list_calculations(calc_type=calc_type, status=status, limit=limit)
+            calculations = await asyncio.to_thread(db.list_calculations, calc_type=calc_type, status=status, limit=limit)
             return {
                 "success": True,
                 "calculations": calculations,
@@ -716,7 +894,7 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
             Database statistics including total records, distribution by type and status, etc.
         """
         try:
-            stats = db.get_statistics()
+            stats = await asyncio.to_thread(db.get_statistics)
             return {
                 "success": True,
                 "statistics": stats
@@ -740,7 +918,7 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
             Result of the deletion operation
         """
         try:
-            success = db.delete_record(calculation_id)
+            success = await asyncio.to_thread(db.delete_record, calculation_id)
             if success:
                 return {
                     "success": True,
@@ -773,11 +951,7 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
                 ......
             }
         """
-
-        files_exist = {}
-        for path in file_paths:
-            files_exist[path] = os.path.exists(path)
-        return files_exist
+        return await asyncio.to_thread(_check_paths_exist, file_paths)
 
     @mcp.tool(name="read_calc_results_from_db")
     async def read_calc_results_from_db(calc_ids: list[str]) -> Dict[str, Any]:
@@ -799,8 +973,10 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
             }
         """
         llm_friendly_results = {}
+        # 只需摘要字段，不反序列化结构、能带等大对象
+        records = await asyncio.to_thread(db.read_records_summary, calc_ids)
         for calc_id in calc_ids:
-            data = read_record(calc_id)
+            data = records.get(calc_id)
             if data is not None:
                 llm_friendly_results[calc_id] = extract_llm_friendly_result(data)
             else:
@@ -819,19 +995,36 @@ def main(config_path: str = None, port: int = 8933, host: str = "0.0.0.0"):
             Result of the cancellation operations
         """
         result_dict = {}
-        for calc_id in calc_ids:
-            try:
-                data = read_record(calc_id)
-                if data is not None:
-                    if data.get("status") == "running":
-                        result = cancel_slurm_job(data.get("slurm_id"))
-                        data["status"] = "cancelled"
-                        write_record(calc_id, data)
-                        result_dict[calc_id] = result
-                    else:
-                        result_dict[calc_id] = {"success": True, "message": f"SLURM job {data.get('slurm_id')} is not running"}
-            except Exception as e:
+        try:
+            records = await asyncio.to_thread(db.read_records_bulk, calc_ids)
+        except Exception as e:
+            return {calc_id: {"success": False, "error": str(e)} for calc_id in calc_ids}
+        
+        # 所有需要取消的任务共用一次scancel，状态更新在一个事务中写入
+        to_cancel = {
+            calc_id: data for calc_id, data in records.items()
+            if data.get("status") in _CANCELLABLE_STATUSES and data.get("slurm_id")
+        }
+        try:
+            cancel_results = await asyncio.to_thread(
+                cancel_slurm_jobs, [data["slurm_id"] for data in to_cancel.values()]
+            )
+            cancelled = {}
+            for calc_id, data in to_cancel.items():
+                result = cancel_results[str(data["slurm_id"])]
+                if result["success"]:
+                    data["status"] = "cancelled"
+                    cancelled[calc_id] = data
+                result_dict[calc_id] = result
+            await asyncio.to_thread(db.write_records_bulk, cancelled)
+        except Exception as e:
+            for calc_id in to_cancel:
                 result_dict[calc_id] = {"success": False, "error": str(e)}
+        
+        for calc_id in calc_ids:
+            data = records.get(calc_id)
+            if data is not None and calc_id not in to_cancel:
+                result_dict[calc_id] = {"success": True, "message": f"SLURM job {data.get('slurm_id')} is not running"}
             
         return result_dict
 
@@ -4,9 +4,94 @@ import json
 from typing import Dict, Any, Optional, List
 from pathlib import Path
 import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    from monty.json import MSONable, MontyEncoder, MontyDecoder
+except ImportError:  # monty 随 pymatgen 安装，缺失时大对象仍用pickle
+    MSONable = None
+
+# 直接存为列的简单字段
+_SCALAR_FIELDS = (
+    'slurm_id', 'success', 'error', 'status', 'calculate_path', 'calc_type',
+    'total_energy', 'max_force', 'ionic_steps', 'efermi', 'is_metal',
+    'soc', 'restart_id', 'kpath', 'n_kpoints',
+)
+# 复杂对象字段到BLOB列的映射
+_COMPLEX_FIELD_COLUMNS = {
+    'structure': 'structure_blob',
+    'band_structure': 'band_structure_blob',
+    'dos': 'dos_blob',
+    'eigenvalues': 'eigenvalues_blob',
+    'eigen_values': 'eigenvalues_blob',  # 兼容不同命名
+    'band_gap': 'band_gap_blob',
+    'stress': 'stress_blob',
+    'incar_tags': 'incar_tags_blob',
+    'cbm': 'cbm_blob',
+    'vbm': 'vbm_blob'
+}
+
+# 摘要查询的列（状态查询等高频操作只需这些字段）
+SUMMARY_COLUMNS = (
+    'calculation_id', 'slurm_id', 'success', 'error', 'status', 'calculate_path', 'calc_type',
+    'total_energy', 'max_force', 'ionic_steps', 'efermi', 'is_metal',
+    'soc', 'restart_id', 'kpath', 'n_kpoints', 'band_gap_blob', 'stress_blob', 'cbm_blob', 'vbm_blob',
+)
+
+# BLOB首字节标记：纯数据用JSON，pymatgen对象用as_dict()后的JSON，其余对象用pickle；
+# 无标记的旧记录按pickle读取
+_JSON_TAG = b'\x00'
+_PICKLE_TAG = b'\x01'
+_MSON_TAG = b'\x02'
+# 这些字段总是pymatgen对象，不做纯数据检查
+_HEAVY_FIELDS = frozenset({'structure', 'band_structure', 'dos'})
+
+
+def _is_plain(value: Any) -> bool:
+    """判断对象能否经JSON无损往返（str键字典、列表、标量）"""
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return True
+    if isinstance(value, list):
+        return all(_is_plain(v) for v in value)
+    if isinstance(value, dict):
+        return all(isinstance(k, str) and _is_plain(v) for k, v in value.items())
+    return False
+
+
+def _encode_blob(key: str, value: Any) -> bytes:
+    """序列化复杂字段，写入首字节标记"""
+    if key not in _HEAVY_FIELDS and _is_plain(value):
+        return _JSON_TAG + json.dumps(value, separators=(',', ':')).encode('utf-8')
+    if MSONable is not None and isinstance(value, MSONable):
+        try:
+            # as_dict() 带有 @module/@class，读取时可还原，且不依赖pickle的类布局
+            return _MSON_TAG + json.dumps(value, cls=MontyEncoder, separators=(',', ':')).encode('utf-8')
+        except (TypeError, ValueError) as e:
+            logging.warning(f"Failed to serialize {key} as JSON, falling back to pickle: {e}")
+    return _PICKLE_TAG + pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _decode_blob(blob: bytes) -> Any:
+    """按首字节标记反序列化复杂字段"""
+    tag = blob[:1]
+    if tag == _JSON_TAG:
+        return json.loads(blob[1:])
+    if tag == _PICKLE_TAG:
+        return pickle.loads(blob[1:])
+    if tag == _MSON_TAG:
+        return json.loads(blob[1:], cls=MontyDecoder)
+    return pickle.loads(blob)
+
 
 class VaspCalculationDB:
-    """VASP计算记录的SQLite数据库管理类"""
+    """VASP计算记录的SQLite数据库管理类
+    
+    数据库使用WAL日志模式，会在 db_path 旁生成 -wal/-shm 附属文件。
+    每个线程复用自己的连接，连接级PRAGMA只在打开时设置一次。
+    反序列化后的记录保存在进程内LRU缓存中，任何写入/删除都会使对应记录失效。
+    """
     
     def __init__(self, db_path: str):
         """
@@ -17,11 +102,108 @@ class VaspCalculationDB:
         """
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        # 记录缓存：calculation_id -> 反序列化后的记录（LRU）
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._cache_size = 256
+        self._cache_lock = threading.Lock()
+        # 写入版本号：读取期间若发生写入，则不缓存可能过期的结果
+        self._version = 0
         self._init_database()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接（首次调用时创建并设置PRAGMA）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row  # 使结果可以按列名访问
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-20000")
+            self._local.conn = conn
+        return conn
+        
+    def _cache_get(self, calculation_id: str) -> Optional[Dict[str, Any]]:
+        """从缓存读取记录，返回浅拷贝（嵌套对象为共享引用，调用方不应原地修改）"""
+        with self._cache_lock:
+            data = self._cache.get(calculation_id)
+            if data is None:
+                return None
+            self._cache.move_to_end(calculation_id)
+            return dict(data)
+    
+    def _cache_put(self, calculation_id: str, data: Dict[str, Any], version: int):
+        """缓存读取到的记录；读取开始后若有写入则放弃缓存"""
+        with self._cache_lock:
+            if version != self._version:
+                return
+            self._cache[calculation_id] = data
+            self._cache.move_to_end(calculation_id)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+    
+    def _invalidate(self, calculation_ids):
+        """使指定记录的缓存失效"""
+        with self._cache_lock:
+            self._version += 1
+            for calc_id in calculation_ids:
+                self._cache.pop(calc_id, None)
+        
+    @contextmanager
+    def transaction(self):
+        """
+        在当前线程的连接上开启写事务（BEGIN IMMEDIATE），正常退出时提交，异常时回滚
+        
+        事务内调用 write_record / write_records_bulk / delete_record 会并入同一事务，
+        缓存在最外层事务提交后统一失效。
+        
+        示例:
+            with db.transaction():
+                db.write_record(id1, data1)
+                db.delete_record(id2)
+        """
+        conn = self._connect()
+        if getattr(self._local, 'tx_depth', 0):
+            # 嵌套调用并入外层事务
+            self._local.tx_depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.tx_depth -= 1
+            return
+        
+        self._local.tx_depth = 1
+        self._local.tx_dirty = set()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+        finally:
+            self._local.tx_depth = 0
+            dirty, self._local.tx_dirty = self._local.tx_dirty, set()
+            self._invalidate(dirty)
+    
+    @contextmanager
+    def _read_conn(self):
+        """
+        只读查询使用的连接。不能把连接本身当作上下文管理器：sqlite3.Connection 退出时会提交，
+        在 transaction() 内读取会提前提交外层事务，之后的异常就无法回滚
+        """
+        yield self._connect()
+    
+    def _mark_dirty(self, calculation_ids):
+        """记录当前事务修改过的记录，提交后使其缓存失效"""
+        self._local.tx_dirty.update(calculation_ids)
         
     def _init_database(self):
         """初始化数据库表结构"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
+            # WAL模式会持久化在数据库文件中，读写互不阻塞
+            conn.execute("PRAGMA journal_mode=WAL")
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS calculations (
                     calculation_id TEXT PRIMARY KEY,
@@ -69,54 +251,30 @@ class VaspCalculationDB:
             conn.execute("CREATE INDEX IF NOT EXISTS idx_status ON calculations(status)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_restart_id ON calculations(restart_id)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON calculations(created_at)")
+            # list_calculations 按状态/类型过滤并按时间排序时直接走索引
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_status_type_created ON calculations(status, calc_type, created_at)")
             
-    def write_record(self, calculation_id: str, data: dict):
+    def _serialize_record(self, calculation_id: str, data: dict) -> Dict[str, Any]:
         """
-        写入计算记录
+        将计算数据转换为数据库行（简单字段 + 序列化后的复杂对象）
         
         Args:
             calculation_id: 计算ID
             data: 计算数据字典
+            
+        Returns:
+            列名到值的字典
         """
         # 提取简单字段
-        simple_fields = {
-            'calculation_id': calculation_id,
-            'slurm_id': data.get('slurm_id'),
-            'success': data.get('success'),
-            'error': data.get('error'),
-            'status': data.get('status'),
-            'calculate_path': data.get('calculate_path'),
-            'calc_type': data.get('calc_type'),
-            'total_energy': data.get('total_energy'),
-            'max_force': data.get('max_force'),
-            'ionic_steps': data.get('ionic_steps'),
-            'efermi': data.get('efermi'),
-            'is_metal': data.get('is_metal'),
-            'soc': data.get('soc'),
-            'restart_id': data.get('restart_id'),
-            'kpath': data.get('kpath'),
-            'n_kpoints': data.get('n_kpoints'),
-        }
+        simple_fields = {'calculation_id': calculation_id}
+        simple_fields.update((field, data.get(field)) for field in _SCALAR_FIELDS)
         
         # 序列化复杂对象
         blob_fields = {}
-        complex_field_mapping = {
-            'structure': 'structure_blob',
-            'band_structure': 'band_structure_blob',
-            'dos': 'dos_blob',
-            'eigenvalues': 'eigenvalues_blob',
-            'eigen_values': 'eigenvalues_blob',  # 兼容不同命名
-            'band_gap': 'band_gap_blob',
-            'stress': 'stress_blob',
-            'incar_tags': 'incar_tags_blob',
-            'cbm': 'cbm_blob',
-            'vbm': 'vbm_blob'
-        }
-        
-        for data_key, blob_key in complex_field_mapping.items():
+        for data_key, blob_key in _COMPLEX_FIELD_COLUMNS.items():
             if data_key in data and data[data_key] is not None:
                 try:
-                    blob_fields[blob_key] = pickle.dumps(data[data_key])
+                    blob_fields[blob_key] = _encode_blob(data_key, data[data_key])
                 except Exception as e:
                     logging.warning(f"Failed to serialize {data_key}: {e}")
                     blob_fields[blob_key] = None
@@ -124,9 +282,19 @@ class VaspCalculationDB:
                 blob_fields[blob_key] = None
         
         # 合并所有字段
-        all_fields = {**simple_fields, **blob_fields}
+        return {**simple_fields, **blob_fields}
+            
+    def write_record(self, calculation_id: str, data: dict):
+        """
+        写入计算记录
+        
+        Args:
+            calculation_id: 计算ID
+            data: 计算数据字典
+        """
+        all_fields = self._serialize_record(calculation_id, data)
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self.transaction() as conn:
             # 使用INSERT OR REPLACE以支持更新
             placeholders = ', '.join(['?' for _ in all_fields])
             columns = ', '.join(all_fields.keys())
@@ -141,7 +309,110 @@ class VaspCalculationDB:
                 "UPDATE calculations SET updated_at = CURRENT_TIMESTAMP WHERE calculation_id = ?",
                 (calculation_id,)
             )
+            self._mark_dirty([calculation_id])
+            
+    def write_records_bulk(self, records: Dict[str, dict]):
+        """
+        在单个事务中批量写入计算记录
+        
+        Args:
+            records: 计算ID到计算数据字典的映射
+        """
+        if not records:
+            return
+        # 先完成全部序列化，事务内只做写入
+        rows = [self._serialize_record(calc_id, data) for calc_id, data in records.items()]
+        columns = ', '.join(rows[0].keys())
+        placeholders = ', '.join(['?' for _ in rows[0]])
+        
+        with self.transaction() as conn:
+            # INSERT OR REPLACE 会整行重建，updated_at 取默认值 CURRENT_TIMESTAMP
+            conn.executemany(f"""
+                INSERT OR REPLACE INTO calculations ({columns})
+                VALUES ({placeholders})
+            """, [list(row.values()) for row in rows])
+            self._mark_dirty(records.keys())
             
+    def update_records_fields(self, updates: Dict[str, Dict[str, Any]]):
+        """
+        在单个事务中只更新记录的指定字段，其余列（如结构、能带等大对象）保持不变
+        
+        Args:
+            updates: 计算ID到{字段名: 新值}的映射，不属于表结构的字段会被忽略
+        """
+        # 按更新的列组合分组，每组一次 executemany
+        groups: Dict[tuple, list] = {}
+        for calc_id, fields in updates.items():
+            columns = {}
+            for key, value in fields.items():
+                if key in _SCALAR_FIELDS:
+                    columns[key] = value
+                elif key in _COMPLEX_FIELD_COLUMNS:
+                    try:
+                        columns[_COMPLEX_FIELD_COLUMNS[key]] = None if value is None else _encode_blob(key, value)
+                    except Exception as e:
+                        logging.warning(f"Failed to serialize {key}: {e}")
+                        columns[_COMPLEX_FIELD_COLUMNS[key]] = None
+            if columns:
+                groups.setdefault(tuple(columns), []).append([*columns.values(), calc_id])
+        if not groups:
+            return
+        
+        with self.transaction() as conn:
+            for columns, params in groups.items():
+                assignments = ', '.join(f"{column} = ?" for column in columns)
+                conn.executemany(
+                    f"UPDATE calculations SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE calculation_id = ?",
+                    params
+                )
+            self._mark_dirty(updates.keys())
+            
+    def _deserialize_row(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """
+        将数据库行转换为计算数据字典，反序列化复杂对象
+        
+        Args:
+            row: 数据库查询结果行
+            
+        Returns:
+            计算数据字典
+        """
+        data = dict(row)
+        
+        # 反序列化BLOB字段
+        blob_field_mapping = {
+            'structure_blob': 'structure',
+            'band_structure_blob': 'band_structure',
+            'dos_blob': 'dos',
+            'eigenvalues_blob': 'eigenvalues',
+            'band_gap_blob': 'band_gap',
+            'stress_blob': 'stress',
+            'incar_tags_blob': 'incar_tags',
+            'cbm_blob': 'cbm',
+            'vbm_blob': 'vbm'
+        }
+        
+        for blob_key, data_key in blob_field_mapping.items():
+            if blob_key not in data:
+                # 只查询了部分列
+                continue
+            if data[blob_key] is not None:
+                try:
+                    data[data_key] = _decode_blob(data[blob_key])
+                except Exception as e:
+                    logging.warning(f"Failed to deserialize {data_key}: {e}")
+                    data[data_key] = None
+            else:
+                data[data_key] = None
+            # 删除blob字段，保持接口兼容
+            del data[blob_key]
+            
+        # 删除时间戳字段，保持接口兼容
+        data.pop('created_at', None)
+        data.pop('updated_at', None)
+        
+        return data
+    
     def read_record(self, calculation_id: str) -> Optional[Dict[str, Any]]:
         """
         读取计算记录
@@ -152,50 +423,88 @@ class VaspCalculationDB:
         Returns:
             计算数据字典，如果不存在则返回None
         """
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row  # 使结果可以按列名访问
+        cached = self._cache_get(calculation_id)
+        if cached is not None:
+            return cached
+        
+        version = self._version
+        with self._read_conn() as conn:
             cursor = conn.execute(
                 "SELECT * FROM calculations WHERE calculation_id = ?", 
                 (calculation_id,)
             )
             row = cursor.fetchone()
             
-            if row is None:
-                return None
-                
-            # 转换为字典并反序列化复杂对象
-            data = dict(row)
-            
-            # 反序列化BLOB字段
-            blob_field_mapping = {
-                'structure_blob': 'structure',
-                'band_structure_blob': 'band_structure',
-                'dos_blob': 'dos',
-                'eigenvalues_blob': 'eigenvalues',
-                'band_gap_blob': 'band_gap',
-                'stress_blob': 'stress',
-                'incar_tags_blob': 'incar_tags',
-                'cbm_blob': 'cbm',
-                'vbm_blob': 'vbm'
-            }
+        if row is None:
+            return None
+        data = self._deserialize_row(row)
+        self._cache_put(calculation_id, data, version)
+        return dict(data)
+    
+    def read_records_bulk(self, calculation_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        用一次查询批量读取计算记录
+        
+        Args:
+            calculation_ids: 计算ID列表
             
-            for blob_key, data_key in blob_field_mapping.items():
-                if data[blob_key] is not None:
-                    try:
-                        data[data_key] = pickle.loads(data[blob_key])
-                    except Exception as e:
-                        logging.warning(f"Failed to deserialize {data_key}: {e}")
-                        data[data_key] = None
-                else:
-                    data[data_key] = None
-                # 删除blob字段，保持接口兼容
-                del data[blob_key]
-                
-            # 删除时间戳字段，保持接口兼容
-            data.pop('created_at', None)
-            data.pop('updated_at', None)
+        Returns:
+            计算ID到计算数据字典的映射，不存在的ID不包含在结果中
+        """
+        records = {}
+        ids = []
+        for calc_id in dict.fromkeys(calculation_ids):
+            cached = self._cache_get(calc_id)
+            if cached is not None:
+                records[calc_id] = cached
+            else:
+                ids.append(calc_id)
+        if not ids:
+            return records
+        
+        version = self._version
+        rows = []
+        with self._read_conn() as conn:
+            # 分块查询，避免超过SQLite参数个数上限
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ', '.join(['?' for _ in chunk])
+                cursor = conn.execute(
+                    f"SELECT * FROM calculations WHERE calculation_id IN ({placeholders})",
+                    chunk
+                )
+                rows.extend(cursor.fetchall())
+        
+        for row in rows:
+            data = self._deserialize_row(row)
+            self._cache_put(row['calculation_id'], data, version)
+            records[row['calculation_id']] = dict(data)
+        return records
+    
+    def read_records_summary(self, calculation_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量读取记录摘要：只查询标量列与体积很小的 band_gap/stress/cbm/vbm，
+        不读取也不反序列化结构、能带、DOS、本征值等大对象
+        
+        Args:
+            calculation_ids: 计算ID列表
             
-            return data
+        Returns:
+            计算ID到摘要字典的映射，不存在的ID不包含在结果中
+        """
+        ids = list(dict.fromkeys(calculation_ids))
+        columns = ', '.join(SUMMARY_COLUMNS)
+        rows = []
+        with self._read_conn() as conn:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ', '.join(['?' for _ in chunk])
+                cursor = conn.execute(
+                    f"SELECT {columns} FROM calculations WHERE calculation_id IN ({placeholders})",
+                    chunk
+                )
+                rows.extend(cursor.fetchall())
+        return {row['calculation_id']: self._deserialize_row(row) for row in rows}
     
     def list_calculations(self, 
                          calc_type: Optional[str] = None,
@@ -212,9 +521,7 @@ class VaspCalculationDB:
         Returns:
             计算记录列表
         """
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            
+        with self._read_conn() as conn:
             query = "SELECT calculation_id, calc_type, status, total_energy, efermi, created_at FROM calculations"
             params = []
             conditions = []
@@ -249,12 +556,13 @@ class VaspCalculationDB:
         Returns:
             是否成功删除
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self.transaction() as conn:
             cursor = conn.execute(
                 "DELETE FROM calculations WHERE calculation_id = ?",
                 (calculation_id,)
             )
-            return cursor.rowcount > 0
+            self._mark_dirty([calculation_id])
+        return cursor.rowcount > 0
     
     def get_statistics(self) -> Dict[str, Any]:
         """
@@ -263,19 +571,16 @@ class VaspCalculationDB:
         Returns:
             统计信息字典
         """
-        with sqlite3.connect(self.db_path) as conn:
-            stats = {}
-            
-            # 总记录数
-            cursor = conn.execute("SELECT COUNT(*) FROM calculations")
-            stats['total_calculations'] = cursor.fetchone()[0]
-            
-            # 按计算类型统计
-            cursor = conn.execute("SELECT calc_type, COUNT(*) FROM calculations GROUP BY calc_type")
-            stats['by_calc_type'] = dict(cursor.fetchall())
-            
-            # 按状态统计
-            cursor = conn.execute("SELECT status, COUNT(*) FROM calculations GROUP BY status")
-            stats['by_status'] = dict(cursor.fetchall())
-            
-            return stats
\ No newline at end of file
+        with self._read_conn() as conn:
+            # 一次分组查询得到类型×状态的计数，总数和各维度计数在内存中汇总
+            cursor = conn.execute(
+                "SELECT calc_type, status, COUNT(*) FROM calculations GROUP BY calc_type, status"
+            )
+            rows = cursor.fetchall()
+        
+        stats = {'total_calculations': 0, 'by_calc_type': {}, 'by_status': {}}
+        for calc_type, status, count in rows:
+            stats['total_calculations'] += count
+            stats['by_calc_type'][calc_type] = stats['by_calc_type'].get(calc_type, 0) + count
+            stats['by_status'][status] = stats['by_status'].get(status, 0) + count
+        return stats
\ No newline at end of file
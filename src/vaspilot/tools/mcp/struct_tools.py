@@ -1,4 +1,6 @@
 import os
+import atexit
+import threading
 import traceback
 from pathlib import Path
 from typing import Dict, Any, List, Optional, Union, Tuple
@@ -11,6 +13,89 @@ from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
 from pymatgen.analysis.structure_matcher import StructureMatcher
 import uuid
 from pymatgen.io.vasp import Poscar
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+
+# 按API密钥复用的MPRester实例（复用HTTPS会话，避免每次搜索重新建立连接）
+_MPR_CACHE: Dict[str, MPRester] = {}
+_MPR_LOCK = threading.Lock()
+
+
+def _close_mp_rester(mpr: MPRester):
+    try:
+        mpr.session.close()
+    except Exception:
+        pass
+
+
+def _get_mp_rester(api_key: str) -> MPRester:
+    """获取（必要时创建）该API密钥对应的MPRester"""
+    with _MPR_LOCK:
+        mpr = _MPR_CACHE.get(api_key)
+        if mpr is None:
+            mpr = MPRester(api_key)
+            _MPR_CACHE[api_key] = mpr
+        return mpr
+
+
+def _drop_mp_rester(api_key: str):
+    """丢弃并关闭缓存的MPRester"""
+    with _MPR_LOCK:
+        mpr = _MPR_CACHE.pop(api_key, None)
+    if mpr is not None:
+        _close_mp_rester(mpr)
+
+
+@atexit.register
+def _close_all_mp_resters():
+    with _MPR_LOCK:
+        resters = list(_MPR_CACHE.values())
+        _MPR_CACHE.clear()
+    for mpr in resters:
+        _close_mp_rester(mpr)
+
+
+# 扩展名到pymatgen格式名的映射
+_FMT_BY_EXT = {".poscar": "poscar", ".vasp": "poscar", ".cif": "cif"}
+
+
+def _structure_format(path: str, default_fmt: Optional[str] = "poscar") -> Optional[str]:
+    """根据扩展名（不区分大小写）判断结构文件格式"""
+    return _FMT_BY_EXT.get(os.path.splitext(path)[1].lower(), default_fmt)
+
+
+@lru_cache(maxsize=128)
+def _parse_structure_file(path: str, fmt: Optional[str], mtime_ns: int, size: int) -> Structure:
+    """解析结构文件（按路径、格式、修改时间和大小缓存，文件修改后自动失效）；fmt为None时由pymatgen按文件名判断格式"""
+    if fmt is None:
+        return Structure.from_file(path)
+    with open(path, "r") as f:
+        return Structure.from_str(f.read(), fmt=fmt)
+
+
+def load_structure(path: str, default_fmt: Optional[str] = "poscar") -> Structure:
+    """
+    读取结构文件，同一未修改的文件只解析一次；返回副本，变换操作不会影响缓存
+    
+    参数:
+        path: 结构文件路径
+        default_fmt: 扩展名不是 .vasp/.poscar/.cif 时使用的格式，None表示由pymatgen按文件名判断（CONTCAR、vasprun.xml等）
+    """
+    st = os.stat(path)
+    return _parse_structure_file(path, _structure_format(path, default_fmt), st.st_mtime_ns, st.st_size).copy()
+
+
+def _write_poscar(structure: Structure, path: str, sort: bool = False):
+    """以POSCAR格式写出结构：先写临时文件再原子替换，避免中途崩溃留下不完整的文件"""
+    tmp_path = path + ".tmp"
+    try:
+        Poscar(structure, sort_structure=sort).write_file(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 def analyze_crystal_structure(struct_input: Union[str, Structure]) -> Dict[str, Any]:
     """
@@ -28,7 +113,7 @@ def analyze_crystal_structure(struct_input: Union[str, Structure]) -> Dict[str,
         if isinstance(struct_input, str):
             # 如果是文件路径
             if os.path.exists(struct_input):
-                struct = Structure.from_file(struct_input)
+                struct = load_structure(struct_input, default_fmt=None)
             else:
                 return {
                     "success": False,
@@ -58,13 +143,15 @@ def analyze_crystal_structure(struct_input: Union[str, Structure]) -> Dict[str,
         
         # 获取晶格参数
         lattice = struct.lattice
+        a, b, c = lattice.abc
+        alpha, beta, gamma = lattice.angles
         lattice_parameters = {
-            "a": lattice.a,
-            "b": lattice.b,
-            "c": lattice.c,
-            "alpha": lattice.alpha,
-            "beta": lattice.beta,
-            "gamma": lattice.gamma,
+            "a": a,
+            "b": b,
+            "c": c,
+            "alpha": alpha,
+            "beta": beta,
+            "gamma": gamma,
             "volume": lattice.volume
         }
         
@@ -185,11 +272,13 @@ def search_materials_project(
         search_params["chunk_size"] = limit
         # 执行搜索
         try:
-            with MPRester(api_key) as mpr:
-                materials_data = mpr.materials.summary.search(
-                    **search_params
-                )
+            mpr = _get_mp_rester(api_key)
+            materials_data = mpr.materials.summary.search(
+                **search_params
+            )
         except Exception as query_error:
+            # 连接可能已失效，下次调用时重新创建
+            _drop_mp_rester(api_key)
             return {
                 "success": False,
                 "error": f"搜索Materials Project时出错: {str(query_error)}\n{traceback.format_exc()}",
@@ -212,36 +301,45 @@ def search_materials_project(
                 "search_criteria": search_criteria
             }
 
-        # 处理搜索结果
-        materials_list = []
-        for material_data in materials_data:
-            try:
-                
-                structure: Structure = material_data.structure
-                if structure is None:
-                    continue
-                
-                material_info = {
-                    "material_id": material_data.material_id,
-                    "formula": structure.composition.reduced_formula,
-                    "band_gap": material_data.band_gap,
-                    "energy_above_hull": material_data.energy_above_hull,
-                    "is_gap_direct": material_data.is_gap_direct,
-                }
-                
-                # 如果提供了下载路径，保存结构文件
-                if download_path:
-                    os.makedirs(download_path, exist_ok=True)
-                    filename = f"{material_data.material_id}_{structure.composition.reduced_formula}.vasp"
-                    filepath = os.path.join(download_path, filename)
-                    structure.to(filename=filepath, fmt="poscar")
-                    material_info["downloaded_file"] = filepath
-                
-                materials_list.append(material_info)
-                
-            except Exception as material_error:
-                print(f"处理材料 {material_data.material_id} 时出错: {str(material_error)}")
-                continue
+        # 处理搜索结果：一次性提取字段，结构文件单独批量写出
+        valid_data = [m for m in materials_data if m.structure is not None]
+        formulas = [m.structure.composition.reduced_formula for m in valid_data]
+        materials_list = [
+            {
+                "material_id": m.material_id,
+                "formula": formula,
+                "band_gap": m.band_gap,
+                "energy_above_hull": m.energy_above_hull,
+                "is_gap_direct": m.is_gap_direct,
+            }
+            for m, formula in zip(valid_data, formulas)
+        ]
+        
+        # 如果提供了下载路径，并行保存结构文件（已存在的文件不再重写）
+        if download_path:
+            os.makedirs(download_path, exist_ok=True)
+            pending_writes = []
+            for m, formula, material_info in zip(valid_data, formulas, materials_list):
+                filepath = os.path.join(download_path, f"{m.material_id}_{formula}.vasp")
+                material_info["downloaded_file"] = filepath
+                if not os.path.exists(filepath):
+                    pending_writes.append((material_info, m.structure, filepath))
+            
+            if pending_writes:
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    futures = [
+                        (material_info, executor.submit(_write_poscar, structure, filepath))
+                        for material_info, structure, filepath in pending_writes
+                    ]
+                    failed = set()
+                    for material_info, future in futures:
+                        try:
+                            future.result()
+                        except Exception as material_error:
+                            print(f"处理材料 {material_info['material_id']} 时出错: {str(material_error)}")
+                            failed.add(id(material_info))
+                if failed:
+                    materials_list = [info for info in materials_list if id(info) not in failed]
         
         return {
             "success": True,
@@ -277,13 +375,25 @@ def create_crystal_structure(
         Dict包含创建的结构和相关信息
     """
     try:
+        # asarray 对已是float64的数组不复制
+        positions = np.asarray(positions, dtype=np.float64)
+        lattice_vectors = np.asarray(lattice_vectors, dtype=np.float64)
+        if lattice_vectors.shape != (3, 3):
+            return {
+                "success": False,
+                "error": f"创建晶体结构时出错:\n 晶格向量应为3x3矩阵，实际形状为 {lattice_vectors.shape}",
+            }
+        if positions.ndim != 2 or positions.shape[1] != 3 or positions.shape[0] != len(elements):
+            return {
+                "success": False,
+                "error": f"创建晶体结构时出错:\n 原子位置形状 {positions.shape} 与元素数量 {len(elements)} 不匹配",
+            }
         structure = Structure(lattice=Lattice(lattice_vectors), species=elements, coords=positions, coords_are_cartesian=cartesian)
         structure_id = str(uuid.uuid4())
         structure_name = f"{structure.composition.reduced_formula}_{structure_id}.vasp"
         if output_path:
             os.makedirs(output_path, exist_ok=True)
-            poscar = Poscar(structure, sort_structure=True)
-            poscar.write_file(filename=f"{output_path}/{structure_name}")
+            _write_poscar(structure, f"{output_path}/{structure_name}", sort=True)
         
         return {
             "success": True,
@@ -297,6 +407,17 @@ def create_crystal_structure(
         }
     
 
+def _is_diagonal_matrix(matrix) -> bool:
+    """判断是否为3x3对角矩阵"""
+    try:
+        return len(matrix) == 3 and all(
+            len(row) == 3 and all(row[j] == 0 for j in range(3) if j != i)
+            for i, row in enumerate(matrix)
+        )
+    except TypeError:
+        return False
+
+
 def make_supercell(
     struct_path: str,
     supercell_matrix: List[List[int]],
@@ -317,15 +438,7 @@ def make_supercell(
     try:
         # 处理输入参数
         if os.path.exists(struct_path):
-            fmt = None
-            if struct_path.split(".")[-1] in ["poscar", "vasp"]:
-                fmt = "poscar"
-            elif struct_path.split(".")[-1] in ["cif"]:
-                fmt = "cif"
-            else:
-                fmt = "poscar"
-            with open(struct_path, "r") as f:
-                struct = Structure.from_str(f.read(), fmt=fmt)
+            struct = load_structure(struct_path)
         else:
             return {
                 "success": False,
@@ -333,21 +446,27 @@ def make_supercell(
                 "rotated_structure": None
             }
         
-        # 使用pymatgen创建超胞
-        supercell_transform = SupercellTransformation(supercell_matrix)
-        supercell_struct = supercell_transform.apply_transformation(struct)
+        original_num_atoms = len(struct)
+        # 使用pymatgen创建超胞（对角矩阵直接按各轴倍数扩胞，其余情况走通用变换）
+        if _is_diagonal_matrix(supercell_matrix):
+            # load_structure 返回的已是副本，可直接原地扩胞
+            supercell_struct = struct
+            supercell_struct.make_supercell([supercell_matrix[i][i] for i in range(3)])
+        else:
+            supercell_transform = SupercellTransformation(supercell_matrix)
+            supercell_struct = supercell_transform.apply_transformation(struct)
         
         # 如果提供了输出路径，保存结构文件
         if output_path:
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
         else:
             output_path = struct_path.replace('.vasp', f'_sc_{supercell_matrix}.vasp')
-        supercell_struct.to(filename=output_path, fmt="poscar")
+        _write_poscar(supercell_struct, output_path)
         
         return {
             "success": True,
             "error": None,
-            "original_num_atoms": len(struct),
+            "original_num_atoms": original_num_atoms,
             "supercell_num_atoms": len(supercell_struct),
             "supercell_matrix": supercell_matrix,
             "output_path": output_path
@@ -383,15 +502,7 @@ def rotate_structure(
     try:
         # 处理输入参数
         if os.path.exists(struct_path):
-            fmt = None
-            if struct_path.split(".")[-1] in ["poscar", "vasp"]:
-                fmt = "poscar"
-            elif struct_path.split(".")[-1] in ["cif"]:
-                fmt = "cif"
-            else:
-                fmt = "poscar"
-            with open(struct_path, "r") as f:
-                struct = Structure.from_str(f.read(), fmt=fmt)
+            struct = load_structure(struct_path)
         else:
             return {
                 "success": False,
@@ -406,7 +517,7 @@ def rotate_structure(
         # 如果提供了输出路径，保存结构文件
         if output_path:
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            rotated_struct.to(filename=output_path, fmt="poscar")
+            _write_poscar(rotated_struct, output_path)
         
         return {
             "success": True,
@@ -445,15 +556,7 @@ def symmetrize_structure(
     try:
         # 处理输入参数
         if os.path.exists(struct_path):
-            fmt = None
-            if struct_path.split(".")[-1] in ["poscar", "vasp"]:
-                fmt = "poscar"
-            elif struct_path.split(".")[-1] in ["cif"]:
-                fmt = "cif"
-            else:
-                fmt = "poscar"
-            with open(struct_path, "r") as f:
-                struct = Structure.from_str(f.read(), fmt=fmt)
+            struct = load_structure(struct_path)
         else:
             return {
                 "success": False,
@@ -465,17 +568,20 @@ def symmetrize_structure(
         spg_analyzer = SpacegroupAnalyzer(struct, symprec=tolerance)
         symmetrized_struct = spg_analyzer.get_symmetrized_structure()
         
-        # 获取对称化前后的比较信息
-        original_space_group = SpacegroupAnalyzer(struct).get_space_group_symbol()
+        # 获取对称化前后的比较信息（原结构按默认精度判断，与默认精度相同时复用已有的分析结果）
+        if tolerance == 0.01:
+            original_space_group = spg_analyzer.get_space_group_symbol()
+        else:
+            original_space_group = SpacegroupAnalyzer(struct).get_space_group_symbol()
         symmetrized_space_group = SpacegroupAnalyzer(symmetrized_struct).get_space_group_symbol()
         
         # 如果提供了输出路径，保存结构文件
         if output_path:
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            symmetrized_struct.to(filename=output_path, fmt="poscar")
+            _write_poscar(symmetrized_struct, output_path)
         else:
             output_path = struct_path.replace('.vasp', f'_sym.vasp')
-            symmetrized_struct.to(filename=output_path, fmt="poscar")
+            _write_poscar(symmetrized_struct, output_path)
         
         return {
             "success": True,
@@ -514,13 +620,7 @@ def convert_structure_format(
     try:
         # 检查输入文件是否存在
         if os.path.exists(input_path):
-            fmt = None
-            if input_path.split(".")[-1] in ["poscar", "vasp"]:
-                fmt = "poscar"
-            elif input_path.split(".")[-1] in ["cif"]:
-                fmt = "cif"
-            with open(input_path, "r") as f:
-                struct = Structure.from_str(f.read(), fmt=fmt)
+            struct = load_structure(input_path, default_fmt=None)
         else:
             return {
                 "success": False,
@@ -532,7 +632,7 @@ def convert_structure_format(
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
         # 保存结构
-        struct.to(filename=output_path, fmt="poscar")
+        _write_poscar(struct, output_path)
         
         return {
             "success": True,
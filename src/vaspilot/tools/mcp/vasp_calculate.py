@@ -1,17 +1,101 @@
 import os
+import re
 import time
+import asyncio
+import atexit
+import threading
 import subprocess
 import shutil
-from pymatgen.core import Element, Structure
-from pymatgen.io.vasp import VaspInput, Vasprun, Kpoints, Poscar, Chgcar, Potcar, Outcar
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pymatgen.core import SETTINGS, Element, Structure
+from pymatgen.io.vasp import VaspInput, Vasprun, Kpoints, Poscar, Chgcar, Potcar, Outcar, Incar
 from pymatgen.electronic_structure.bandstructure import BandStructure, BandStructureSymmLine
 import math
 import pathlib
-from typing import Optional, Dict, Any, Union
+from typing import Optional, Dict, Any, Union, List
 import numpy as np
 from mcp.server.fastmcp import Context
 
 
+# 同时进行中的sbatch调用上限，避免批量提交时压垮SLURM控制器
+MAX_INFLIGHT_SBATCH = 8
+_SBATCH_SEMAPHORE = threading.BoundedSemaphore(MAX_INFLIGHT_SBATCH)
+
+
+def _fast_copy_file(src: str, dst: str, st: Optional[os.stat_result] = None):
+    """
+    在内核中复制单个文件（copy_file_range，不支持时回退到sendfile，再回退到普通读写），
+    最后一次性恢复权限和时间戳，效果等同于shutil.copy2。
+    已存在的dst先删除再新建，若它是指向模板等文件的硬链接，不会改写链接的原文件
+    """
+    if st is None:
+        st = os.stat(src)
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        try:
+            os.unlink(dst)
+        except FileNotFoundError:
+            pass
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            remaining = st.st_size
+            try:
+                while remaining > 0:
+                    copied = os.copy_file_range(src_fd, dst_fd, remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            except (AttributeError, OSError):
+                try:
+                    while remaining > 0:
+                        copied = os.sendfile(dst_fd, src_fd, st.st_size - remaining, remaining)
+                        if copied == 0:
+                            break
+                        remaining -= copied
+                except (AttributeError, OSError):
+                    # 从头用普通读写重新复制
+                    os.lseek(src_fd, 0, os.SEEK_SET)
+                    os.lseek(dst_fd, 0, os.SEEK_SET)
+                    os.ftruncate(dst_fd, 0)
+                    with open(src_fd, "rb", closefd=False) as fsrc, open(dst_fd, "wb", closefd=False) as fdst:
+                        shutil.copyfileobj(fsrc, fdst)
+            os.fchmod(dst_fd, st.st_mode & 0o7777)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def _link_or_copy_file(src: str, dst: str, st: os.stat_result):
+    """硬链接单个文件（符号链接先解析到实际文件），跨设备等无法链接时回退到复制"""
+    try:
+        if os.path.lexists(dst):
+            os.remove(dst)
+        os.link(os.path.realpath(src), dst)
+    except OSError:
+        _fast_copy_file(src, dst, st)
+
+
+@lru_cache(maxsize=32)
+def _list_attachments(src_dir: str, mtime_ns: int) -> tuple:
+    """
+    列出目录下的普通文件 ((路径, 文件名), ...)，按目录修改时间缓存：增删文件会改变目录mtime，缓存自动失效。
+    只缓存文件名，文件内容可能在目录mtime不变时被修改，大小和时间戳在复制时重新获取
+    """
+    with os.scandir(src_dir) as it:
+        return tuple((entry.path, entry.name) for entry in it if entry.is_file())
+
+
+def _fast_copy_tree(src_dir: str, dst_dir: str):
+    """将src_dir下的所有普通文件（不含子目录）复制到dst_dir"""
+    for src, name in _list_attachments(src_dir, os.stat(src_dir).st_mtime_ns):
+        _fast_copy_file(src, f"{dst_dir}/{name}")
+
+
 def _submit_slurm_job(calc_type: str, calculate_path: str, 
                      attachment_path: Optional[str] = None) -> Dict[str, Any]:
     """
@@ -30,16 +114,12 @@ def _submit_slurm_job(calc_type: str, calculate_path: str,
         # 如果指定了附件路径，复制附件文件到计算目录
         if attachment_path is not None and os.path.exists(attachment_path):
             # 复制附件目录下的所有文件到计算目录
-            for file_name in os.listdir(attachment_path):
-                src_file = os.path.join(attachment_path, file_name)
-                dst_file = os.path.join(calculate_path, file_name)
-                if os.path.isfile(src_file):
-                    shutil.copy2(src_file, dst_file)
+            _fast_copy_tree(attachment_path, calculate_path)
         
         # 查找SLURM脚本文件
         slurm_script_path = None
         for script_name in ['submit.sh', 'run.sh', 'slurm.sh']:
-            script_path = os.path.join(calculate_path, script_name)
+            script_path = f"{calculate_path}/{script_name}"
             if os.path.exists(script_path):
                 slurm_script_path = script_path
                 break
@@ -55,13 +135,12 @@ def _submit_slurm_job(calc_type: str, calculate_path: str,
             }
         
         # 提交SLURM任务
-        time.sleep(3)
-        result = subprocess.run(['sbatch', slurm_script_path], 
-                              capture_output=True, text=True, cwd=calculate_path)
+        with _SBATCH_SEMAPHORE:
+            result = subprocess.run(['sbatch', slurm_script_path], capture_output=True, text=True, cwd=calculate_path)
         
         if result.returncode == 0:
-            # 从sbatch输出中提取任务ID
-            slurm_id = result.stdout.strip().split()[-1]
+            # 从sbatch输出（"Submitted batch job <id>"）中提取任务ID
+            slurm_id = result.stdout.rstrip().rpartition(' ')[2]
             
             return {
                 "slurm_id": slurm_id,
@@ -92,6 +171,60 @@ def _submit_slurm_job(calc_type: str, calculate_path: str,
         }
 
 
+@lru_cache(maxsize=64)
+def _cached_potcar(potcar_symbols: tuple) -> Potcar:
+    """
+    按POTCAR符号序列缓存Potcar对象，同一体系的多步计算只从赝势库读取一次。
+    键保留元素顺序（需与POSCAR一致），返回的对象为共享实例，不要修改。
+    """
+    return Potcar(list(potcar_symbols))
+
+
+def _potcar_symbols(poscar: Poscar, potcar_map: Optional[Dict] = None) -> tuple:
+    """
+    按POSCAR中元素出现的顺序（连续相同的元素合并为一组）得到POTCAR符号序列，
+    未在potcar_map中指定的元素使用元素符号本身。不会修改传入的potcar_map
+    """
+    potcar_map = potcar_map or {}
+    # site_symbols 只遍历一次原子，顺序与写出的POSCAR一致
+    return tuple(potcar_map.get(symbol, symbol) for symbol in poscar.site_symbols)
+
+
+def _potcar_template(work_dir: str, potcar: Potcar) -> str:
+    """
+    同一赝势组合的POTCAR在 {work_dir}/.potcar_templates 下只写一次，返回模板文件路径。
+    键包含赝势库路径、泛函、符号顺序和各赝势的TITEL（含版本日期），更换赝势库后不会复用旧模板；
+    先写临时文件再原子替换，并发提交时不会读到不完整的模板
+    """
+    titels = [single.keywords.get("TITEL", "") for single in potcar]
+    key_parts = [str(SETTINGS.get("PMG_VASP_PSP_DIR", "")), str(potcar.functional), *potcar.symbols, *titels]
+    key = hashlib.sha1("|".join(key_parts).encode()).hexdigest()[:16]
+    template_dir = f"{work_dir}/.potcar_templates"
+    template_path = f"{template_dir}/POTCAR_{key}"
+    if not os.path.exists(template_path):
+        os.makedirs(template_dir, exist_ok=True)
+        tmp_path = f"{template_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(potcar))
+        os.replace(tmp_path, template_path)
+    return template_path
+
+
+def _write_vasp_inputs(job_dir: str, work_dir: str, vasp_input: VaspInput):
+    """
+    写出VASP输入文件：INCAR/KPOINTS/POSCAR 每个任务单独写；POTCAR 从模板硬链接（跨设备时复制），
+    参数扫描等同一体系的多个任务不再重复写出相同的POTCAR
+    """
+    os.makedirs(job_dir, exist_ok=True)
+    # 与 VaspInput.write_input 相同，按各对象的字符串形式写出；INCAR 可能以普通字典传入
+    inputs = {"INCAR": Incar(vasp_input["INCAR"]), "KPOINTS": vasp_input["KPOINTS"], "POSCAR": vasp_input["POSCAR"]}
+    for name, value in inputs.items():
+        with open(f"{job_dir}/{name}", "w") as f:
+            f.write(str(value))
+    template_path = _potcar_template(work_dir, vasp_input["POTCAR"])
+    _link_or_copy_file(template_path, f"{job_dir}/POTCAR", os.stat(template_path))
+
+
 def vasp_relaxation(calculation_id: str, work_dir: str, struct: Structure, 
                    kpoints: Kpoints, incar_dict: dict, attachment_path: Optional[str] = None, potcar_map: Optional[Dict] = None) -> Dict[str, Any]:
     """
@@ -110,38 +243,20 @@ def vasp_relaxation(calculation_id: str, work_dir: str, struct: Structure,
     """
     Name = calculation_id
     calc_dir = os.path.abspath(f'{work_dir}/{Name}')
-    if potcar_map is None:
-        potcar_map = {}
     # 创建VASP输入文件
-    # 手动获取元素列表，确保顺序与POSCAR一致
     poscar = Poscar(struct)
-    unique_species = []
-    for species in poscar.structure.species:
-        species: Element
-        if unique_species:
-            if species.symbol != unique_species[-1]:
-                if species.symbol not in potcar_map:
-                    potcar_map[species.symbol] = species.symbol
-                unique_species.append(species.symbol)
-        else:
-            if species.symbol not in potcar_map:
-                potcar_map[species.symbol] = species.symbol
-            unique_species.append(species.symbol)
-    potcar_symbols = []
-    for symbol in unique_species:
-        potcar_symbols.append(potcar_map[symbol])
+    potcar_symbols = _potcar_symbols(poscar, potcar_map)
 
     vasp_input = VaspInput(
         poscar=poscar,
         incar=incar_dict,
         kpoints=kpoints,
-        potcar=Potcar(potcar_symbols)
+        potcar=_cached_potcar(potcar_symbols)
     )
     
     # 准备结构优化目录
-    rlx_dir = os.path.join(calc_dir, "rlx/")
-    os.makedirs(rlx_dir, exist_ok=True)
-    vasp_input.write_input(rlx_dir)
+    rlx_dir = f"{calc_dir}/rlx"
+    _write_vasp_inputs(rlx_dir, work_dir, vasp_input)
     
     # 提交SLURM任务
     return _submit_slurm_job("relaxation", rlx_dir, attachment_path)
@@ -168,44 +283,26 @@ def vasp_scf(calculation_id: str, work_dir: str, struct: Structure,
     """
     Name = calculation_id
     calc_dir = os.path.abspath(f'{work_dir}/{Name}')
-    if potcar_map is None:
-        potcar_map = {}
     # 创建VASP输入文件
-    # 手动获取元素列表，确保顺序与POSCAR一致
     poscar = Poscar(struct)
-    unique_species = []
-    for species in poscar.structure.species:
-        species: Element
-        if unique_species:
-            if species.symbol != unique_species[-1]:
-                if species.symbol not in potcar_map:
-                    potcar_map[species.symbol] = species.symbol
-                unique_species.append(species.symbol)
-        else:
-            if species.symbol not in potcar_map:
-                potcar_map[species.symbol] = species.symbol
-            unique_species.append(species.symbol)
-    potcar_symbols = []
-    for symbol in unique_species:
-        potcar_symbols.append(potcar_map[symbol])
+    potcar_symbols = _potcar_symbols(poscar, potcar_map)
 
     vasp_input = VaspInput(
         poscar=poscar,
         incar=incar_dict,
         kpoints=kpoints,
-        potcar=Potcar(potcar_symbols)
+        potcar=_cached_potcar(potcar_symbols)
     )
 
     # 准备自洽场计算目录
-    scf_dir = os.path.join(calc_dir, "scf/")
-    os.makedirs(scf_dir, exist_ok=True)
-    vasp_input.write_input(scf_dir)
+    scf_dir = f"{calc_dir}/scf"
+    _write_vasp_inputs(scf_dir, work_dir, vasp_input)
     
-    # 复制相关文件
+    # 复制相关文件（CHGCAR/WAVECAR可能有数GB，在内核中复制）
     if chgcar_path is not None and os.path.exists(chgcar_path):
-        shutil.copy2(chgcar_path, os.path.join(scf_dir, "CHGCAR"))
+        _fast_copy_file(chgcar_path, f"{scf_dir}/CHGCAR")
     if wavecar_path is not None and os.path.exists(wavecar_path):
-        shutil.copy2(wavecar_path, os.path.join(scf_dir, "WAVECAR"))
+        _fast_copy_file(wavecar_path, f"{scf_dir}/WAVECAR")
     
     # 提交SLURM任务
     return _submit_slurm_job("scf", scf_dir, attachment_path)
@@ -234,49 +331,333 @@ def vasp_nscf(calculation_id: str, work_dir: str, struct: Structure,
     """
     Name = calculation_id
     calc_dir = os.path.abspath(f'{work_dir}/{Name}')
-    if potcar_map is None:
-        potcar_map = {}
     # 创建VASP输入文件
-    # 手动获取元素列表，确保顺序与POSCAR一致
     poscar = Poscar(struct)
-    unique_species = []
-    for species in poscar.structure.species:
-        species: Element
-        if unique_species:
-            if species.symbol != unique_species[-1]:
-                if species.symbol not in potcar_map:
-                    potcar_map[species.symbol] = species.symbol
-                unique_species.append(species.symbol)
-        else:
-            if species.symbol not in potcar_map:
-                potcar_map[species.symbol] = species.symbol
-            unique_species.append(species.symbol)
-    potcar_symbols = []
-    for symbol in unique_species:
-        potcar_symbols.append(potcar_map[symbol])
+    potcar_symbols = _potcar_symbols(poscar, potcar_map)
 
     vasp_input = VaspInput(
         poscar=poscar,
         incar=incar_dict,
         kpoints=kpoints,
-        potcar=Potcar(potcar_symbols)
+        potcar=_cached_potcar(potcar_symbols)
     )
     
     # 准备能带计算目录
-    band_dir = os.path.join(calc_dir, "band/")
-    os.makedirs(band_dir, exist_ok=True)
-    vasp_input.write_input(band_dir)
+    band_dir = f"{calc_dir}/band"
+    _write_vasp_inputs(band_dir, work_dir, vasp_input)
     
-    # 复制相关文件
+    # 复制相关文件（CHGCAR/WAVECAR可能有数GB，在内核中复制）
     if os.path.exists(chgcar_path):
-        shutil.copy2(chgcar_path, os.path.join(band_dir, "CHGCAR"))
+        _fast_copy_file(chgcar_path, f"{band_dir}/CHGCAR")
     if wavecar_path is not None and os.path.exists(wavecar_path):
-        shutil.copy2(wavecar_path, os.path.join(band_dir, "WAVECAR"))
+        _fast_copy_file(wavecar_path, f"{band_dir}/WAVECAR")
     
     # 提交SLURM任务
     return _submit_slurm_job("nscf", band_dir, attachment_path)
 
 
+_SUBMITTERS = {"relaxation": vasp_relaxation, "scf": vasp_scf, "nscf": vasp_nscf}
+
+
+def vasp_submit_batch(jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    并发提交多个VASP计算任务（写输入文件、复制附件和sbatch在线程中重叠进行）
+    
+    参数:
+        jobs: 任务列表，每项为 {"calc_type": "relaxation"/"scf"/"nscf", 其余为对应vasp_*函数的参数}
+        
+    返回:
+        与jobs顺序一致的提交结果列表
+    """
+    def submit(job):
+        job = dict(job)
+        calc_type = job.pop("calc_type")
+        try:
+            return _SUBMITTERS[calc_type](**job)
+        except Exception as e:
+            return {
+                "slurm_id": None,
+                "calc_type": calc_type,
+                "calculate_path": None,
+                "success": False,
+                "error": str(e),
+                "status": "failed"
+            }
+    
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(32, len(jobs))) as executor:
+        return list(executor.map(submit, jobs))
+
+
+class _SqueueMonitor:
+    """
+    后台常驻的 `squeue --me -i <秒>` 进程，持续缓存当前用户所有排队/运行中任务的状态。
+    查询时直接读取最近一次的快照，不再每次调用squeue；快照过期或进程异常时返回None，由调用方回退到直接查询。
+    """
+
+    def __init__(self, interval: int = 10):
+        self.interval = interval
+        self._lock = threading.Lock()
+        # 每次快照更新（或监控进程退出）时调用的回调，供长轮询等待状态变化
+        self._listeners = set()
+        self._snapshot: Optional[Dict[str, str]] = None
+        self._snapshot_time = 0.0
+        self._proc: Optional[subprocess.Popen] = None
+        self._thread: Optional[threading.Thread] = None
+        self._last_start = 0.0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            # 进程退出后不立即重启，避免squeue不可用时反复创建进程
+            now = time.monotonic()
+            if now - self._last_start < 60:
+                return
+            self._last_start = now
+            try:
+                self._proc = subprocess.Popen(
+                    ['squeue', '--me', '-i', str(self.interval), '--noheader', '--format=%i|%T'],
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+                )
+            except OSError as e:
+                print(f"⚠️ 无法启动squeue监控进程: {e}")
+                self._proc = None
+                return
+            self._thread = threading.Thread(target=self._reader, args=(self._proc,), daemon=True)
+            self._thread.start()
+
+    def _reader(self, proc: subprocess.Popen):
+        current = {}
+        for line in proc.stdout:
+            line = line.strip()
+            if not line:
+                # 每轮输出以空行结束，整体替换快照
+                with self._lock:
+                    self._snapshot = current
+                    self._snapshot_time = time.monotonic()
+                self._notify()
+                current = {}
+                continue
+            job_id, sep, state = line.partition('|')
+            # 跳过每轮开头打印的时间行
+            if sep:
+                current[job_id] = state.strip()
+        with self._lock:
+            self._snapshot = None
+        self._notify()
+
+    def _notify(self):
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def add_listener(self, listener):
+        with self._lock:
+            self._listeners.add(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            self._listeners.discard(listener)
+
+    def snapshot(self) -> Optional[Dict[str, str]]:
+        """返回最近一次的 {slurm_id: 状态} 快照；没有足够新的快照时返回None"""
+        self._ensure_started()
+        with self._lock:
+            if self._snapshot is None or time.monotonic() - self._snapshot_time > 2 * self.interval:
+                return None
+            return self._snapshot
+
+    def stop(self):
+        with self._lock:
+            proc = self._proc
+            self._proc = None
+        if proc is not None and proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+_SQUEUE_MONITOR = _SqueueMonitor()
+atexit.register(_SQUEUE_MONITOR.stop)
+
+
+async def wait_for_slurm_change(slurm_ids: List[str], timeout: float) -> bool:
+    """
+    在事件循环中等待任一SLURM任务的队列状态变化（包括离开队列），供状态查询做长轮询，不占用线程。
+    返回是否检测到变化：不在当前快照中的任务（已结束或刚提交）视为已变化，立即返回True；
+    监控不可用或超时返回False，由调用方按原方式轮询
+    """
+    slurm_ids = [str(slurm_id) for slurm_id in slurm_ids if slurm_id]
+    if not slurm_ids or timeout <= 0:
+        return False
+    snapshot = _SQUEUE_MONITOR.snapshot()
+    if snapshot is None:
+        return False
+    if any(slurm_id not in snapshot for slurm_id in slurm_ids):
+        return True
+    initial = {slurm_id: snapshot[slurm_id] for slurm_id in slurm_ids}
+    
+    loop = asyncio.get_running_loop()
+    event = asyncio.Event()
+    
+    def listener():
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+    
+    _SQUEUE_MONITOR.add_listener(listener)
+    try:
+        deadline = loop.time() + timeout
+        while True:
+            # 先清除再检查，检查之后到达的通知不会丢失
+            event.clear()
+            snapshot = _SQUEUE_MONITOR.snapshot()
+            if snapshot is None:
+                return False
+            if any(snapshot.get(slurm_id) != state for slurm_id, state in initial.items()):
+                return True
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+    finally:
+        _SQUEUE_MONITOR.remove_listener(listener)
+
+# 已结束任务的最终状态缓存 {slurm_id: 状态}，结束后的状态不会再变化，无需重复查询sacct
+_TERMINAL_STATE_CACHE: "OrderedDict[str, str]" = OrderedDict()
+_TERMINAL_STATE_CACHE_SIZE = 10000
+_TERMINAL_STATE_LOCK = threading.Lock()
+_TERMINAL_STATE_PREFIXES = ("COMPLETED", "FAILED", "CANCELLED", "TIMEOUT", "OUT_OF_MEMORY",
+                            "NODE_FAIL", "BOOT_FAIL", "DEADLINE", "PREEMPTED")
+
+
+# squeue 是否支持 --only-job-state（None 表示尚未探测）。管理员开启 enable_job_state_cache 后
+# 该选项由控制器的状态缓存直接应答；旧版本SLURM不认识该选项，探测一次后回退到普通查询
+_SUPPORTS_ONLY_JOB_STATE: Optional[bool] = None
+
+
+def _squeue_states(slurm_ids: list[str]) -> Dict[str, str]:
+    """用一次squeue查询一批任务的状态"""
+    global _SUPPORTS_ONLY_JOB_STATE
+    jobs_csv = ','.join(slurm_ids)
+    if _SUPPORTS_ONLY_JOB_STATE is not False:
+        result = subprocess.run(['squeue', '--jobs', jobs_csv, '--only-job-state', '-O', 'JobID:|,State:|', '--noheader'],
+                                capture_output=True, text=True)
+        stderr = result.stderr.lower()
+        if result.returncode != 0 and ('unrecognized option' in stderr or 'invalid option' in stderr
+                                       or 'only-job-state' in stderr):
+            _SUPPORTS_ONLY_JOB_STATE = False
+        else:
+            _SUPPORTS_ONLY_JOB_STATE = True
+    if _SUPPORTS_ONLY_JOB_STATE is False:
+        result = subprocess.run(['squeue', '--noheader', '--jobs', jobs_csv, '--format=%i|%T'],
+                                capture_output=True, text=True)
+    
+    # 队列中有已结束的任务时squeue可能返回非0，仍解析其输出
+    states = {}
+    for line in result.stdout.splitlines():
+        fields = line.split('|')
+        if len(fields) >= 2:
+            states[fields[0].strip()] = fields[1].strip()
+    return states
+
+
+def _query_slurm_states(slurm_ids: list[str]) -> Dict[str, str]:
+    """
+    批量查询SLURM任务状态：排队/运行中的任务优先读取后台squeue监控的快照（快照不可用时用一次squeue查询），
+    不在队列中的任务再用一次sacct查询最终状态
+
+    参数:
+        slurm_ids: SLURM任务ID列表
+
+    返回:
+        {slurm_id: SLURM状态字符串}，查询不到的任务不包含在结果中
+    """
+    states = {}
+    if not slurm_ids:
+        return states
+    
+    # 已知结束的任务直接使用缓存的最终状态
+    with _TERMINAL_STATE_LOCK:
+        for slurm_id in slurm_ids:
+            state = _TERMINAL_STATE_CACHE.get(slurm_id)
+            if state is not None:
+                _TERMINAL_STATE_CACHE.move_to_end(slurm_id)
+                states[slurm_id] = state
+    if states:
+        slurm_ids = [slurm_id for slurm_id in slurm_ids if slurm_id not in states]
+        if not slurm_ids:
+            return states
+    wanted = set(slurm_ids)
+
+    snapshot = _SQUEUE_MONITOR.snapshot()
+    if snapshot is not None:
+        # 快照之后新提交的任务不在其中，会交给下面的sacct查询
+        for slurm_id in slurm_ids:
+            if slurm_id in snapshot:
+                states[slurm_id] = snapshot[slurm_id]
+    else:
+        for job_id, state in _squeue_states(slurm_ids).items():
+            if job_id in wanted:
+                states[job_id] = state
+
+    finished = [slurm_id for slurm_id in slurm_ids if slurm_id not in states]
+    wanted = set(finished)
+    if finished:
+        sacct_result = subprocess.run(['sacct', '--jobs', ','.join(finished), '--format=JobID,State',
+                                       '--parsable2', '--noheader'],
+                                      capture_output=True, text=True)
+        if sacct_result.returncode == 0:
+            for line in sacct_result.stdout.splitlines():
+                job_id, _, state = line.strip().partition('|')
+                # 只取作业本身的状态，跳过 .batch/.extern 等作业步
+                if job_id in wanted and job_id not in states:
+                    states[job_id] = state.strip()
+    
+            with _TERMINAL_STATE_LOCK:
+                for job_id in finished:
+                    state = states.get(job_id)
+                    if state is not None and state.startswith(_TERMINAL_STATE_PREFIXES):
+                        _TERMINAL_STATE_CACHE[job_id] = state
+                while len(_TERMINAL_STATE_CACHE) > _TERMINAL_STATE_CACHE_SIZE:
+                    _TERMINAL_STATE_CACHE.popitem(last=False)
+    return states
+
+
+def _read_failed_log(calculate_path: str) -> str:
+    """从log或OUTCAR中提取VASP报错信息"""
+    err_str = """ -----------------------------------------------------------------------------
+|                                                                             |
+|     EEEEEEE  RRRRRR   RRRRRR   OOOOOOO  RRRRRR      ###     ###     ###     |
+|     E        R     R  R     R  O     O  R     R     ###     ###     ###     |
+|     E        R     R  R     R  O     O  R     R     ###     ###     ###     |
+|     EEEEE    RRRRRR   RRRRRR   O     O  RRRRRR       #       #       #      |
+|     E        R   R    R   R    O     O  R   R                               |
+|     E        R    R   R    R   O     O  R    R      ###     ###     ###     |
+|     EEEEEEE  R     R  R     R  OOOOOOO  R     R     ###     ###     ###     |"""
+    try:
+        if os.path.exists(f"{calculate_path}/log"):
+            with open(f"{calculate_path}/log", "r") as f:
+                log_content = f.read().split(err_str)[1]
+
+        else:
+            with open(f"{calculate_path}/OUTCAR", "r") as f:
+                log_content = f.read().split(err_str)[1]
+    except:
+        log_content = f" SLURM job failed without any error message"
+    return log_content
+
+
 def check_status(calc_dict: dict[str, dict[str, Any]]) -> Dict[str, Any]:
     """
     检查SLURM任务状态并返回计算结果
@@ -287,6 +668,15 @@ def check_status(calc_dict: dict[str, dict[str, Any]]) -> Dict[str, Any]:
     返回:
         Dict包含每个任务的状态和结果
     """
+    try:
+        # 所有任务共用一次squeue和一次sacct查询
+        slurm_ids = list(dict.fromkeys(
+            str(job_info["slurm_id"]) for job_info in calc_dict.values() if job_info.get("slurm_id")
+        ))
+        slurm_states = _query_slurm_states(slurm_ids)
+    except Exception as e:
+        slurm_states = None
+        query_error = str(e)
     
     for calc_id, job_info in calc_dict.items():
         slurm_id = job_info["slurm_id"]
@@ -294,61 +684,33 @@ def check_status(calc_dict: dict[str, dict[str, Any]]) -> Dict[str, Any]:
         calculate_path = job_info["calculate_path"]
         
         try:
-            # 检查SLURM任务状态
-            time.sleep(3)
-            result = subprocess.run(['squeue', '-j', slurm_id, '--noheader'], 
-                                  capture_output=True, text=True)
+            if slurm_states is None:
+                raise RuntimeError(query_error)
+            state = slurm_states.get(str(slurm_id))
             
-            if result.returncode == 0 and result.stdout.strip():
-                # 任务仍在运行
+            if state is None:
+                job_status = "unknown"
+                job_result = {"error": "Cannot determine job status"}
+            elif state == "PENDING":
+                job_status = "pending"
+                job_result = {}
+            elif state in ("RUNNING", "CONFIGURING", "COMPLETING", "SUSPENDED", "REQUEUED"):
+                # 任务仍在队列中
                 job_status = "running"
                 job_result = {}
+            elif 'COMPLETED' in state:
+                job_status = "completed"
+                # 读取计算结果
+                job_result = _read_calculation_result(calc_type, calculate_path)
+            elif 'FAILED' in state:
+                job_status = "failed"
+                job_result = {"error": f"{_read_failed_log(calculate_path)}"}
+            elif state.startswith("CANCELLED"):
+                job_status = "cancelled"
+                job_result = {"error": f"SLURM job cancelled"}
             else:
-                # 任务已完成，检查是否成功
-                time.sleep(3)
-                sacct_result = subprocess.run(['sacct', '-j', slurm_id, '--format=State', '--noheader'], 
-                                            capture_output=True, text=True)
-                
-                if sacct_result.returncode == 0:
-                    state = sacct_result.stdout.strip().split('\n')[0].strip()
-                    if 'COMPLETED' in state:
-                        job_status = "completed"
-                        # 读取计算结果
-                        job_result = _read_calculation_result(calc_type, calculate_path)
-                    elif 'FAILED' in state:
-                        err_str = """ -----------------------------------------------------------------------------
-|                                                                             |
-|     EEEEEEE  RRRRRR   RRRRRR   OOOOOOO  RRRRRR      ###     ###     ###     |
-|     E        R     R  R     R  O     O  R     R     ###     ###     ###     |
-|     E        R     R  R     R  O     O  R     R     ###     ###     ###     |
-|     EEEEE    RRRRRR   RRRRRR   O     O  RRRRRR       #       #       #      |
-|     E        R   R    R   R    O     O  R   R                               |
-|     E        R    R   R    R   O     O  R    R      ###     ###     ###     |
-|     EEEEEEE  R     R  R     R  OOOOOOO  R     R     ###     ###     ###     |"""
-                        try:
-                            if os.path.exists(os.path.join(calculate_path, "log")):
-                                with open(os.path.join(calculate_path, "log"), "r") as f:
-                                    log_content = f.read().split(err_str)[1]
-
-                            else:
-                                with open(os.path.join(calculate_path, "OUTCAR"), "r") as f:
-                                    log_content = f.read().split(err_str)[1]
-                        except:
-                            log_content = f" SLURM job failed without any error message"
-                        job_status = "failed"
-                        job_result = {"error": f"{log_content}"}
-                    else:
-                        job_status = state.lower()
-                        job_result = {"error": f"SLURM job exited with state: {state}"}
-                elif state == "CANCELLED":
-                    job_status = "cancelled"
-                    job_result = {"error": f"SLURM job cancelled"}
-                elif state == "PENDING":
-                    job_status = "pending"
-                    job_result = {"error": f"SLURM job pending"}
-                else:
-                    job_status = "unknown"
-                    job_result = {"error": "Cannot determine job status"}
+                job_status = state.lower()
+                job_result = {"error": f"SLURM job exited with state: {state}"}
             
             calc_dict[calc_id].update(job_result)
             calc_dict[calc_id]["status"] = job_status
@@ -365,43 +727,86 @@ def check_status(calc_dict: dict[str, dict[str, Any]]) -> Dict[str, Any]:
     return calc_dict
 
 
+# 解析结果缓存 {(calc_type, calculate_path, mtime_ns, size): 结果}，vasprun.xml 未变化时不重复解析
+_RESULT_CACHE: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_RESULT_CACHE_SIZE = 64
+_RESULT_CACHE_LOCK = threading.Lock()
+
+
 def _read_calculation_result(calc_type: str, calculate_path: str) -> Dict[str, Any]:
     """
-    根据计算类型读取计算结果
+    根据计算类型读取计算结果，同一个未修改的vasprun.xml只解析一次
+    """
+    try:
+        st = os.stat(f"{calculate_path}/vasprun.xml")
+    except OSError:
+        return _parse_calculation_result(calc_type, calculate_path)
+    key = (calc_type, calculate_path, st.st_mtime_ns, st.st_size)
+    with _RESULT_CACHE_LOCK:
+        cached = _RESULT_CACHE.get(key)
+        if cached is not None:
+            _RESULT_CACHE.move_to_end(key)
+            return dict(cached)
+    
+    result = _parse_calculation_result(calc_type, calculate_path)
+    # 解析失败（例如文件仍在写入）不缓存，下次重新解析
+    if result.get("success") is not False:
+        with _RESULT_CACHE_LOCK:
+            _RESULT_CACHE[key] = result
+            while len(_RESULT_CACHE) > _RESULT_CACHE_SIZE:
+                _RESULT_CACHE.popitem(last=False)
+    return dict(result)
+
+
+def _parse_calculation_result(calc_type: str, calculate_path: str) -> Dict[str, Any]:
+    """
+    根据计算类型解析计算结果
     """
+    vasprun_xml = f"{calculate_path}/vasprun.xml"
     try:
         if calc_type == "relaxation":
-            # 读取结构优化结果
-            vasprun = Vasprun(os.path.join(calculate_path, "vasprun.xml"))
-            contcar = Poscar.from_file(os.path.join(calculate_path, "CONTCAR"))
+            # 读取结构优化结果（只需要能量、力和应力，跳过DOS和本征值的解析）
+            vasprun = Vasprun(vasprun_xml, parse_dos=False, parse_eigen=False, parse_potcar_file=False)
+            final_step = vasprun.ionic_steps[-1]
+            # 先取各原子受力平方和的最大值，只开一次方
+            forces = np.asarray(final_step['forces'], dtype=np.float64)
+            max_force = float(np.sqrt((forces * forces).sum(axis=1).max()))
+            # CONTCAR保留完整精度和选择性动力学标记，缺失时才用vasprun中最后一个离子步的结构
+            contcar_path = f"{calculate_path}/CONTCAR"
+            if os.path.exists(contcar_path):
+                structure = Poscar.from_file(contcar_path).structure
+            else:
+                structure = vasprun.final_structure
             
             return {
-                "structure": contcar.structure,
+                "structure": structure,
                 "total_energy": vasprun.final_energy,
-                "max_force": np.max(np.linalg.norm(vasprun.ionic_steps[-1]['forces'], axis=1)),
-                "stress": vasprun.ionic_steps[-1]['stress'],
+                "max_force": max_force,
+                "stress": final_step['stress'],
                 "ionic_steps": len(vasprun.ionic_steps),
                 "status": "completed"
             }
             
         elif calc_type == "scf":
             # 读取自洽场计算结果
-            vasprun = Vasprun(os.path.join(calculate_path, "vasprun.xml"))
+            vasprun = Vasprun(vasprun_xml, parse_potcar_file=False)
+            # 能带结构只构建一次，band_gap 和 is_metal 共用
+            bs = vasprun.get_band_structure()
             
             return {
                 "structure": vasprun.final_structure,
                 "total_energy": vasprun.final_energy,
                 "efermi": vasprun.efermi,
-                "band_gap": vasprun.get_band_structure().get_band_gap(),
+                "band_gap": bs.get_band_gap(),
                 "dos": vasprun.complete_dos,
                 "eigen_values": vasprun.eigenvalues,
-                "is_metal": vasprun.get_band_structure().is_metal(),
+                "is_metal": bs.is_metal(),
                 "status": "completed"
             }
             
         elif calc_type == "nscf":
             # 读取能带计算结果
-            vasprun = Vasprun(os.path.join(calculate_path, "vasprun.xml"))
+            vasprun = Vasprun(vasprun_xml, parse_potcar_file=False)
             bs = vasprun.get_band_structure()
             
             return {
@@ -436,4 +841,34 @@ def cancel_slurm_job(slurm_id: str) -> Dict[str, Any]:
         subprocess.run(['scancel', slurm_id], capture_output=True, text=True)
         return {"success": True, "message": f"SLURM job {slurm_id} cancelled"}
     except Exception as e:
-        return {"success": False, "error": str(e)}
\ No newline at end of file
+        return {"success": False, "error": str(e)}
+
+
+def cancel_slurm_jobs(slurm_ids: list[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    用一次scancel调用取消多个SLURM任务
+    
+    返回:
+        {slurm_id: 取消结果}，scancel 在stderr中报错的任务标记为失败
+    """
+    slurm_ids = list(dict.fromkeys(str(slurm_id) for slurm_id in slurm_ids))
+    if not slurm_ids:
+        return {}
+    try:
+        result = subprocess.run(['scancel', *slurm_ids], capture_output=True, text=True)
+        # 例如 "scancel: error: Kill job error on job id 123: Invalid job id specified"
+        errors = {}
+        wanted = set(slurm_ids)
+        for line in result.stderr.splitlines():
+            if 'error' not in line.lower():
+                continue
+            for job_id in re.findall(r'\b(\d+)\b', line):
+                if job_id in wanted:
+                    errors.setdefault(job_id, line.strip())
+        return {
+            slurm_id: {"success": False, "error": errors[slurm_id]} if slurm_id in errors
+            else {"success": True, "message": f"SLURM job {slurm_id} cancelled"}
+            for slurm_id in slurm_ids
+        }
+    except Exception as e:
+        return {slurm_id: {"success": False, "error": str(e)} for slurm_id in slurm_ids}
\ No newline at end of file
@@ -1,7 +1,7 @@
 import numpy as np
 import time
 import asyncio
-from typing import Type, Optional, Dict, Any, List, Union
+from typing import Type, Optional, Dict, Any, List, Union, ClassVar
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
 from fastmcp.client import Client
@@ -13,6 +13,10 @@ class WaitCalcInput(BaseModel):
 class WaitCalcTool(BaseTool):
     mcp_url: str = "http://localhost:8933/mcp"
     args_schema: Type[BaseModel] = WaitCalcInput
+    MIN_POLL_INTERVAL: ClassVar[float] = 1.0
+    MAX_POLL_INTERVAL: ClassVar[float] = 30.0
+    # 服务端长轮询的最长等待时间：任务状态变化时服务端立即返回
+    LONG_POLL_SECONDS: ClassVar[int] = 120
     
     def __init__(self, mcp_url: str):
         super().__init__(
@@ -22,10 +26,10 @@ class WaitCalcTool(BaseTool):
         # 使用 object.__setattr__ 来绕过 Pydantic 验证
         self.mcp_url = mcp_url
 
-    async def _check_status(self, calculation_ids: List[str]) -> Dict[str, Any]:
-        async with Client(self.mcp_url) as client:
-            # call tool
-            tool_result = await client.call_tool("check_calculation_status", {"calculation_ids": calculation_ids})
+    async def _check_status(self, client: Client, calculation_ids: List[str], wait_seconds: int = 0) -> Dict[str, Any]:
+        # call tool
+        tool_result = await client.call_tool("check_calculation_status",
+                                             {"calculation_ids": calculation_ids, "wait_seconds": wait_seconds})
         if tool_result.data is None:
             return {"error": "No result from check_calculation_status"}
         else:
@@ -55,15 +59,29 @@ class WaitCalcTool(BaseTool):
             return {}
         
         print(f"开始监控计算状态，计算ID列表: {calculation_ids}")
-        
+        try:
+            # 整个等待过程只创建一次事件循环和MCP连接
+            return asyncio.run(self._wait(calculation_ids))
+        except Exception as e:
+            print(f"监控过程中发生错误: {str(e)}")
+            return {"error": f"监控过程中发生错误: {str(e)}"}
+
+    async def _wait(self, calculation_ids: List[str]) -> Dict[str, Any]:
+        """在同一个MCP会话中轮询，直到所有任务结束"""
         # 维护已完成和最终结果的字典
         completed_results = {}
         pending_calc_ids = calculation_ids.copy()
+        # 轮询间隔：有任务状态变化时回到最短间隔，队列无变化时指数增长到上限
+        poll_interval = self.MIN_POLL_INTERVAL
         
-        while pending_calc_ids:
-            try:
-                # 只检查尚未完成的计算任务
-                status_result = asyncio.run(self._check_status(pending_calc_ids))
+        wait_seconds = 0
+        async with Client(self.mcp_url) as client:
+            while pending_calc_ids:
+                # 只检查尚未完成的计算任务；首次立即返回，之后由服务端等待状态变化
+                started = time.monotonic()
+                status_result = await self._check_status(client, pending_calc_ids, wait_seconds)
+                elapsed = time.monotonic() - started
+                wait_seconds = self.LONG_POLL_SECONDS
                 
                 if "error" in status_result:
                     print(f"检查状态时出错: {status_result['error']}")
@@ -98,14 +116,14 @@ class WaitCalcTool(BaseTool):
                     print("所有计算任务已完成")
                     return completed_results
                 
-                # 等待30秒后继续检查
-                print(f"还有 {len(pending_calc_ids)} 个任务未完成，等待30秒后继续检查...")
-                time.sleep(30)
-                
-            except Exception as e:
-                print(f"监控过程中发生错误: {str(e)}")
-                return {"error": f"监控过程中发生错误: {str(e)}"}
+                if newly_completed:
+                    poll_interval = self.MIN_POLL_INTERVAL
+                else:
+                    poll_interval = min(poll_interval * 2, self.MAX_POLL_INTERVAL)
+                # 服务端已经等待过时不再额外等待；服务端无法长轮询时按退避间隔等待
+                if elapsed < poll_interval:
+                    print(f"还有 {len(pending_calc_ids)} 个任务未完成，等待{poll_interval - elapsed:.0f}秒后继续检查...")
+                    await asyncio.sleep(poll_interval - elapsed)
         
         # 理论上不应该到达这里，但为了满足linter要求添加默认返回值
         return completed_results
-        
\ No newline at end of file
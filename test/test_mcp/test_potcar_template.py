@@ -0,0 +1,83 @@
+"""POTCAR模板（_potcar_template）与附件复制（_fast_copy_file/_link_or_copy_file）的测试"""
+import importlib.util
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+MCP_DIR = Path(__file__).resolve().parents[2] / "src" / "vaspilot" / "tools" / "mcp"
+HAS_DEPS = all(importlib.util.find_spec(name) is not None for name in ("pymatgen", "mcp"))
+
+
+def _load_vasp_calculate():
+    spec = importlib.util.spec_from_file_location("vasp_calculate", MCP_DIR / "vasp_calculate.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class _FakeSingle:
+    def __init__(self, titel):
+        self.keywords = {"TITEL": titel}
+
+
+class _FakePotcar(list):
+    """只提供 _potcar_template 用到的属性，不需要本地赝势库"""
+
+    def __init__(self, functional, symbols, titels, text):
+        super().__init__(_FakeSingle(titel) for titel in titels)
+        self.functional = functional
+        self.symbols = symbols
+        self._text = text
+
+    def __str__(self):
+        return self._text
+
+
+@unittest.skipUnless(HAS_DEPS, "需要安装 pymatgen 和 mcp")
+class PotcarTemplateTest(unittest.TestCase):
+    def setUp(self):
+        self.vc = _load_vasp_calculate()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.work_dir = self.tmp.name
+        self.vc.SETTINGS = {"PMG_VASP_PSP_DIR": "/psp/v1"}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _potcar(self, titel="PAW_PBE Si 05Jan2001", text="Si POTCAR\n"):
+        return _FakePotcar("PBE", ["Si"], [titel], text)
+
+    def test_copy_over_hardlink_keeps_template(self):
+        template = self.vc._potcar_template(self.work_dir, self._potcar())
+        job_dir = os.path.join(self.work_dir, "job")
+        os.makedirs(job_dir)
+        job_potcar = os.path.join(job_dir, "POTCAR")
+        self.vc._link_or_copy_file(template, job_potcar, os.stat(template))
+        self.assertTrue(os.path.samefile(template, job_potcar))
+
+        # 附件目录中的POTCAR覆盖任务目录中的硬链接，不能写穿到模板
+        attachment = os.path.join(self.work_dir, "attachment_POTCAR")
+        Path(attachment).write_text("custom POTCAR\n")
+        self.vc._fast_copy_file(attachment, job_potcar)
+
+        self.assertEqual(Path(job_potcar).read_text(), "custom POTCAR\n")
+        self.assertEqual(Path(template).read_text(), "Si POTCAR\n")
+        self.assertFalse(os.path.samefile(template, job_potcar))
+
+    def test_template_reused_for_same_library(self):
+        first = self.vc._potcar_template(self.work_dir, self._potcar())
+        second = self.vc._potcar_template(self.work_dir, self._potcar(text="changed\n"))
+        self.assertEqual(first, second)
+        self.assertEqual(Path(second).read_text(), "Si POTCAR\n")
+
+    def test_template_key_includes_library_and_version(self):
+        base = self.vc._potcar_template(self.work_dir, self._potcar())
+        new_version = self.vc._potcar_template(self.work_dir, self._potcar(titel="PAW_PBE Si 01Jan2020"))
+        self.vc.SETTINGS = {"PMG_VASP_PSP_DIR": "/psp/v2"}
+        new_library = self.vc._potcar_template(self.work_dir, self._potcar())
+        self.assertEqual(len({base, new_version, new_library}), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
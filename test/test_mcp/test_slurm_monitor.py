@@ -0,0 +1,121 @@
+"""squeue 监控与长轮询等待（wait_for_slurm_change）的测试，用假的 squeue 脚本模拟SLURM"""
+import asyncio
+import importlib.util
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+MCP_DIR = Path(__file__).resolve().parents[2] / "src" / "vaspilot" / "tools" / "mcp"
+HAS_DEPS = all(importlib.util.find_spec(name) is not None for name in ("pymatgen", "mcp"))
+
+# 第1、2轮输出任务1为RUNNING，之后任务1离开队列；任务2始终PENDING
+FAKE_SQUEUE = """#!/bin/sh
+n=0
+while true; do
+    date
+    n=$((n+1))
+    if [ $n -lt 3 ]; then printf '1|RUNNING\\n'; fi
+    printf '2|PENDING\\n\\n'
+    sleep 1
+done
+"""
+
+
+def _load_vasp_calculate():
+    spec = importlib.util.spec_from_file_location("vasp_calculate", MCP_DIR / "vasp_calculate.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@unittest.skipUnless(HAS_DEPS, "需要安装 pymatgen 和 mcp")
+class WaitForSlurmChangeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        squeue = Path(self.tmp.name) / "squeue"
+        squeue.write_text(FAKE_SQUEUE)
+        squeue.chmod(squeue.stat().st_mode | stat.S_IEXEC)
+        self.old_path = os.environ["PATH"]
+        os.environ["PATH"] = f"{self.tmp.name}{os.pathsep}{self.old_path}"
+        
+        self.vc = _load_vasp_calculate()
+        self.vc._SQUEUE_MONITOR.stop()
+        self.monitor = self.vc._SqueueMonitor(interval=1)
+        self.vc._SQUEUE_MONITOR = self.monitor
+        deadline = time.monotonic() + 5
+        while self.monitor.snapshot() is None:
+            self.assertLess(time.monotonic(), deadline, "squeue 监控没有产生快照")
+            time.sleep(0.1)
+
+    def tearDown(self):
+        self.monitor.stop()
+        os.environ["PATH"] = self.old_path
+        self.tmp.cleanup()
+
+    def _wait(self, slurm_ids, timeout):
+        started = time.monotonic()
+        changed = asyncio.run(self.vc.wait_for_slurm_change(slurm_ids, timeout))
+        return changed, time.monotonic() - started
+
+    def test_job_missing_from_queue_returns_immediately(self):
+        changed, elapsed = self._wait(["2", "999"], 10)
+        self.assertTrue(changed)
+        self.assertLess(elapsed, 0.5)
+
+    def test_job_leaving_queue_wakes_waiter(self):
+        changed, elapsed = self._wait(["1", "2"], 10)
+        self.assertTrue(changed)
+        self.assertLess(elapsed, 5)
+
+    def test_unchanged_jobs_time_out(self):
+        changed, elapsed = self._wait(["2"], 1.5)
+        self.assertFalse(changed)
+        self.assertGreaterEqual(elapsed, 1.4)
+
+
+@unittest.skipUnless(HAS_DEPS, "需要安装 pymatgen 和 mcp")
+class QuerySlurmStatesTest(unittest.TestCase):
+    """_query_slurm_states：队列快照 + sacct 查询，已结束任务的状态缓存"""
+
+    def setUp(self):
+        self.vc = _load_vasp_calculate()
+        self.vc._SQUEUE_MONITOR.stop()
+        self.calls = []
+
+    def _fake_run(self, cmd, **kwargs):
+        self.calls.append(cmd[0])
+        if cmd[0] == "sacct":
+            stdout = "3|COMPLETED\n3.batch|COMPLETED\n4|FAILED\n"
+        else:
+            stdout = "1|RUNNING\n2|PENDING\n"
+        return subprocess.CompletedProcess(cmd, 0, stdout=stdout, stderr="")
+
+    def test_snapshot_and_sacct(self):
+        with mock.patch.object(self.vc._SQUEUE_MONITOR, "snapshot", return_value={"1": "RUNNING", "2": "PENDING"}), \
+                mock.patch.object(self.vc.subprocess, "run", side_effect=self._fake_run):
+            states = self.vc._query_slurm_states(["1", "2", "3", "4"])
+            self.assertEqual(states, {"1": "RUNNING", "2": "PENDING", "3": "COMPLETED", "4": "FAILED"})
+            self.assertEqual(self.calls, ["sacct"])
+
+            # 已结束任务的状态被缓存，再次查询不再调用sacct
+            self.calls.clear()
+            self.assertEqual(self.vc._query_slurm_states(["3", "4"]), {"3": "COMPLETED", "4": "FAILED"})
+            self.assertEqual(self.calls, [])
+
+    def test_squeue_fallback_without_snapshot(self):
+        with mock.patch.object(self.vc._SQUEUE_MONITOR, "snapshot", return_value=None), \
+                mock.patch.object(self.vc.subprocess, "run", side_effect=self._fake_run):
+            states = self.vc._query_slurm_states(["1", "3"])
+        self.assertEqual(states, {"1": "RUNNING", "3": "COMPLETED"})
+        self.assertEqual(self.calls[0], "squeue")
+        self.assertEqual(self.calls[-1], "sacct")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+"""VaspCalculationDB 的测试（只依赖标准库，monty 缺失时大对象走pickle）"""
+import importlib.util
+import os
+import pickle
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+MCP_DIR = Path(__file__).resolve().parents[2] / "src" / "vaspilot" / "tools" / "mcp"
+
+
+def _load_sqlite_database():
+    spec = importlib.util.spec_from_file_location("sqlite_database", MCP_DIR / "sqlite_database.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+sqlite_database = _load_sqlite_database()
+
+
+class TransactionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = sqlite_database.VaspCalculationDB(os.path.join(self.tmp.name, "calc.db"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _record(self, status):
+        return {"slurm_id": "1", "calc_type": "scf", "status": status, "calculate_path": "/tmp/calc"}
+
+    def test_read_inside_transaction_does_not_commit(self):
+        self.db.write_record("a", self._record("pending"))
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction():
+                self.db.write_record("b", self._record("pending"))
+                self.db.update_records_fields({"a": {"status": "completed"}})
+                # 事务内的各种读取都不能提前提交外层事务
+                self.assertEqual(self.db.read_record("b")["status"], "pending")
+                self.db.read_records_bulk(["a", "b"])
+                self.db.read_records_summary(["a"])
+                self.db.list_calculations()
+                self.db.get_statistics()
+                raise RuntimeError("abort")
+        
+        self.assertIsNone(self.db.read_record("b"))
+        self.assertEqual(self.db.read_record("a")["status"], "pending")
+        self.assertEqual(set(self.db.read_records_bulk(["a", "b"])), {"a"})
+
+    def test_transaction_commits_on_success(self):
+        with self.db.transaction():
+            self.db.write_record("a", self._record("pending"))
+            self.db.read_record("a")
+            self.db.write_record("b", self._record("running"))
+        self.assertEqual(self.db.read_record("b")["status"], "running")
+
+
+class SummaryReadTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = sqlite_database.VaspCalculationDB(os.path.join(self.tmp.name, "calc.db"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_summary_includes_band_edges(self):
+        self.db.write_record("n", {
+            "slurm_id": "1", "calc_type": "nscf", "status": "completed", "calculate_path": "/tmp/calc",
+            "efermi": 5.1, "is_metal": False,
+            "cbm": {"energy": 6.25, "band_index": {"1": [8]}, "kpoint_index": [0]},
+            "vbm": {"energy": 5.0, "band_index": {"1": [7]}, "kpoint_index": [3]},
+        })
+        summary = self.db.read_records_summary(["n"])["n"]
+        self.assertEqual(summary["cbm"]["energy"], 6.25)
+        self.assertEqual(summary["vbm"]["energy"], 5.0)
+        self.assertNotIn("band_structure", summary)
+
+
+class BlobEncodingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "calc.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_plain_data_uses_json_tag(self):
+        value = {"ENCUT": 520, "ISMEAR": 0, "MAGMOM": [1.0, -1.0], "LSORBIT": True}
+        blob = sqlite_database._encode_blob("incar_tags", value)
+        self.assertEqual(blob[:1], sqlite_database._JSON_TAG)
+        self.assertEqual(sqlite_database._decode_blob(blob), value)
+
+    def test_non_json_data_uses_pickle_tag(self):
+        # 非字符串键、元组都不能经JSON无损往返
+        for value in ({1: "a", 2: "b"}, (0.1, 0.2, 0.3)):
+            blob = sqlite_database._encode_blob("cbm", value)
+            self.assertEqual(blob[:1], sqlite_database._PICKLE_TAG)
+            self.assertEqual(sqlite_database._decode_blob(blob), value)
+
+    @unittest.skipIf(sqlite_database.MSONable is None, "需要安装 monty")
+    def test_msonable_uses_mson_tag(self):
+        from monty.json import MSONable
+
+        class Point(MSONable):
+            def __init__(self, x, y):
+                self.x = x
+                self.y = y
+
+        blob = sqlite_database._encode_blob("structure", Point(1, 2))
+        self.assertEqual(blob[:1], sqlite_database._MSON_TAG)
+
+    def test_legacy_untagged_pickle_is_decoded(self):
+        value = {"ENCUT": 400, "kpath": ("G", "X")}
+        self.assertEqual(sqlite_database._decode_blob(pickle.dumps(value)), value)
+
+    def test_legacy_blob_read_from_database(self):
+        db = sqlite_database.VaspCalculationDB(self.db_path)
+        db.write_record("a", {"slurm_id": "1", "calc_type": "scf", "status": "completed",
+                              "calculate_path": "/tmp/calc", "incar_tags": {"ENCUT": 520}})
+        self.assertEqual(db.read_record("a")["incar_tags"], {"ENCUT": 520})
+
+        # 模拟旧版本写入的无标记pickle BLOB
+        legacy = {"ENCUT": 400, 1: "int key"}
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE calculations SET incar_tags_blob = ? WHERE calculation_id = ?",
+                         (pickle.dumps(legacy), "a"))
+        fresh = sqlite_database.VaspCalculationDB(self.db_path)
+        self.assertEqual(fresh.read_record("a")["incar_tags"], legacy)
+        self.assertEqual(fresh.read_records_bulk(["a"])["a"]["incar_tags"], legacy)
+
+
+if __name__ == "__main__":
+    unittest.main()